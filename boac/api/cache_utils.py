@@ -3,10 +3,14 @@ from flask import current_app as app
 
 
 def load_canvas_externals(uid):
+    """Load a student's Canvas profile and course sites. Returns the usual success count and failures, plus the
+    IDs of the student's current-term course sites. Per-site feeds are left to load_canvas_course_externals, so that
+    sites shared by many students are fetched only once."""
     from boac.externals import canvas
 
     success_count = 0
     failures = []
+    site_ids = []
 
     canvas_user_profile = canvas.get_user_for_uid(uid)
     if canvas_user_profile is None:
@@ -18,21 +22,36 @@ def load_canvas_externals(uid):
         sites = canvas.get_student_courses_in_term(uid)
         if sites:
             success_count += 1
-            for site in sites:
-                site_id = site['id']
-                if not canvas.get_course_sections(site_id):
-                    failures.append('canvas.get_course_sections failed for UID {}, site_id {}'.format(
-                        uid,
-                        site_id,
-                    ))
-                    continue
-                success_count += 1
-                if not canvas.get_student_summaries(site_id):
-                    failures.append('canvas.get_student_summaries failed for site_id {}'.format(
-                        site_id,
-                    ))
-                    continue
-                success_count += 1
+            site_ids = [site['id'] for site in sites]
+    return success_count, failures, site_ids
+
+
+def load_canvas_course_externals(site_id):
+    from boac.externals import canvas
+    from boac.lib import analytics
+    from boac.models.section_crosswalk import SectionCrosswalk
+
+    success_count = 0
+    failures = []
+
+    sections = canvas.get_course_sections(site_id)
+    if not sections:
+        failures.append('canvas.get_course_sections failed for site_id {}'.format(
+            site_id,
+        ))
+        return success_count, failures
+    success_count += 1
+    # Record which SIS sections the site's Canvas sections belong to, so that merging enrollments need not load them.
+    SectionCrosswalk.refresh_course(site_id, sections)
+    # Summary feeds for large courses are streamed into the cache rather than held in memory whole, and analyzed on
+    # the way.
+    if not analytics.stow_course_summaries_and_analytics(site_id):
+        failures.append('analytics.stow_course_summaries_and_analytics failed for site_id {}'.format(
+            site_id,
+        ))
+        return success_count, failures
+    # Summaries and analytics
+    success_count += 2
     return success_count, failures
 
 
@@ -60,8 +79,26 @@ def load_sis_externals(sis_term_id, csid):
     return success_count, failures
 
 
-def load_current_term():
-    from boac.lib import berkeley
+def load_member_externals(sis_term_id, csid, uid):
+    """Load and stow external feeds for one student, committing them as a single batch."""
+    success_count, failures, site_ids = load_canvas_externals(uid)
+    s, f = load_sis_externals(sis_term_id, csid)
+    success_count += s
+    failures += f
+    db.session.commit()
+    return success_count, failures, site_ids
+
+
+def load_course_externals(site_id):
+    """Load and stow the feeds for one Canvas course site, committing them as a single batch."""
+    success_count, failures = load_canvas_course_externals(site_id)
+    db.session.commit()
+    return success_count, failures
+
+
+def load_current_term(threads=None):
+    from boac.lib import berkeley, concurrency, http
+    from boac.models import json_cache
     from boac.models.team_member import TeamMember
 
     success_count = 0
@@ -69,27 +106,53 @@ def load_current_term():
 
     term_name = app.config['CANVAS_CURRENT_ENROLLMENT_TERM']
     sis_term_id = berkeley.sis_term_id_for_name(term_name)
+    if threads is None:
+        threads = app.config['CACHE_WARMUP_THREADS']
 
     # Currently, all external data is loaded starting from the individuals who belong
     # to one or more Cohorts.
-    for csid, uid in db.session.query(TeamMember.member_csid, TeamMember.member_uid).distinct():
-        s, f = load_canvas_externals(uid)
+    members = db.session.query(TeamMember.member_csid, TeamMember.member_uid).distinct().all()
+    db.session.commit()
+
+    def load_member(member):
+        csid, uid = member
+        return load_member_externals(sis_term_id, csid, uid)
+
+    # Course sites are collected across all students first, so that each site's feeds are fetched exactly once.
+    site_ids = []
+    site_reference_count = 0
+    for s, f, member_site_ids in concurrency.map_in_app_context(load_member, members, threads):
         success_count += s
         failures += f
-        db.session.commit()
-        s, f = load_sis_externals(sis_term_id, csid)
+        site_reference_count += len(member_site_ids)
+        site_ids.extend(member_site_ids)
+    site_ids = sorted(set(site_ids))
+
+    for s, f in concurrency.map_in_app_context(load_course_externals, site_ids, threads):
         success_count += s
         failures += f
-        db.session.commit()
+    json_cache.wait_for_refreshes()
 
     print('Complete. Fetched {} external feeds.'.format(success_count))
+    print('Loaded {} unique course sites; avoided {} duplicate course site fetches.'.format(
+        len(site_ids),
+        site_reference_count - len(site_ids),
+    ))
     if len(failures):
         print('Failed to fetch {} feeds:'.format(len(failures)))
         print(failures)
+    for host, stats in http.connection_stats().items():
+        print('{}: {} requests, {} connections opened, {} reused.'.format(host, stats['requests'], stats['opened'], stats['reused']))
+    for upstream, stats in http.upstream_stats().items():
+        print('{}: {} requests, {} retries, {} rate limited, {} held back by our rate limit, {} failed.'.format(
+            upstream, stats['requests'], stats['retries'], stats['rate_limited'], stats['rate_limit_waits'], stats['failures'],
+        ))
 
 
-def refresh_current_term():
-    from boac.models import json_cache
-
-    json_cache.clear_current_term()
+def refresh_current_term(force=False):
+    """Refetch only those feeds which have expired or are nearing expiry, or, if forced, all current feeds. Unlike
+    clearing the cache and reloading, this leaves current data in place for the app to use while the refresh runs."""
+    if force:
+        from boac.models import json_cache
+        json_cache.expire_current_term()
     load_current_term()
@@ -1,9 +1,12 @@
 from boac.api.errors import BadRequestError
 from boac.api.errors import ForbiddenRequestError
+from boac.api.result_cache import cached_response
 from boac.api.util import canvas_courses_api_feed
 from boac.externals import canvas
-from boac.lib.analytics import mean_course_analytics_for_user
+from boac.lib import stowed_keys
+from boac.lib.analytics import mean_course_analytics_for_users
 from boac.lib.http import tolerant_jsonify
+from boac.models import json_cache
 from boac.models.cohort_filter import CohortFilter
 from boac.models.team_member import TeamMember
 from flask import current_app as app, jsonify, request
@@ -23,8 +26,12 @@ def teams_members():
     team_codes = get_param(params, 'teamCodes', [])
     order_by = get_param(params, 'orderBy', 'member_name')
     offset = get_param(params, 'offset', 0)
-    limit = get_param(params, 'limit', 50)
-    return jsonify(TeamMember.summarize_team_members(team_codes, order_by, offset, limit))
+    limit = get_limit(params)
+    cursor = get_param(params, 'cursor')
+    try:
+        return jsonify(TeamMember.summarize_team_members(team_codes, order_by, offset, limit, cursor))
+    except ValueError as e:
+        raise BadRequestError(str(e))
 
 
 @app.route('/api/cohorts/all')
@@ -53,16 +60,28 @@ def get_cohort(code):
     order_by = get_param(params, 'orderBy', 'member_name')
     if code.isdigit():
         offset = get_param(params, 'offset', 0)
-        limit = get_param(params, 'limit', 50)
-        cohort = CohortFilter.find_by_id(int(code), order_by, offset, limit)
+        limit = get_limit(params)
+        cursor = get_param(params, 'cursor')
+        try:
+            return cached_response(
+                'cohort/{}'.format(code),
+                [order_by, offset, limit, cursor],
+                lambda: CohortFilter.find_by_id(int(code), order_by, offset, limit, cursor),
+                cohort_id=int(code),
+            )
+        except ValueError as e:
+            raise BadRequestError(str(e))
     else:
-        cohort = TeamMember.for_code(code)
-        load_member_profiles(cohort)
-        # Translate requested order_by to naming convention of TeamMember
-        sort_by = 'uid' if order_by == 'member_uid' else 'name'
-        cohort['members'].sort(key=lambda member: member[sort_by])
+        return cached_response('team/{}'.format(code), [order_by], lambda: load_team(code, order_by), team_codes=[code])
 
-    return tolerant_jsonify(cohort)
+
+def load_team(code, order_by):
+    team = TeamMember.for_code(code)
+    load_member_profiles(team)
+    # Translate requested order_by to naming convention of TeamMember
+    sort_by = 'uid' if order_by == 'member_uid' else 'name'
+    team['members'].sort(key=lambda member: member[sort_by])
+    return team
 
 
 @app.route('/api/cohort/create', methods=['POST'])
@@ -116,22 +135,55 @@ def get_cohort_owned_by(cohort_filter_id, uid):
 
 
 def load_member_profiles(team):
-    for member in team['members']:
-        uid = member['uid']
-        cache_key = 'user/{uid}'.format(uid=uid)
-        canvas_profile = app.cache.get(cache_key) if app.cache else None
-        if not canvas_profile:
-            canvas_profile = canvas.get_user_for_uid(uid)
-            # Cache Canvas profiles
-            if app.cache and canvas_profile:
-                app.cache.set(cache_key, canvas_profile)
-
+    # Feeds missing from the cache are fetched concurrently, within the per-upstream limits of HTTP_UPSTREAM_CONCURRENCY.
+    max_workers = app.config['MEMBER_PROFILE_THREADS']
+    members = team['members']
+    canvas_profiles = load_canvas_profiles([member['uid'] for member in members], max_workers)
+    members_with_profiles = [(member, canvas_profiles[member['uid']]) for member in members if canvas_profiles.get(member['uid'])]
+    all_user_courses = json_cache.stow_many(
+        canvas.get_all_user_courses,
+        [(member['uid'],) for member, canvas_profile in members_with_profiles],
+        max_workers,
+    )
+    members_with_courses = []
+    for (member, canvas_profile), user_courses in zip(members_with_profiles, all_user_courses):
+        member['avatar_url'] = canvas_profile['avatar_url']
+        canvas_courses = canvas_courses_api_feed(canvas.current_term_student_courses(user_courses))
+        if canvas_courses:
+            members_with_courses.append((member, canvas_courses, canvas_profile['id']))
+    # Analyze each course shared by members once, rather than once per member.
+    all_mean_analytics = mean_course_analytics_for_users(
+        [(canvas_courses, canvas_user_id) for member, canvas_courses, canvas_user_id in members_with_courses],
+        max_workers,
+    )
+    for (member, canvas_courses, canvas_user_id), mean_analytics in zip(members_with_courses, all_mean_analytics):
+        member['analytics'] = mean_analytics
+
+
+def load_canvas_profiles(uids, max_workers=1):
+    """Return a dict of Canvas profiles by UID, checking the app cache before loading the rest in bulk."""
+    canvas_profiles = {}
+    for uid in uids:
+        canvas_profile = app.cache.get('user/{uid}'.format(uid=uid)) if app.cache else None
         if canvas_profile:
-            member['avatar_url'] = canvas_profile['avatar_url']
-            canvas_courses = canvas_courses_api_feed(canvas.get_student_courses_in_term(uid))
-            if canvas_courses:
-                member['analytics'] = mean_course_analytics_for_user(canvas_courses, canvas_profile['id'])
+            canvas_profiles[uid] = canvas_profile
+    # Profiles from the app cache were stowed under these keys, and cached results built from them depend on those rows.
+    stowed_keys.record([canvas.get_user_for_uid.stow_key(uid) for uid in canvas_profiles])
+    uncached_uids = [uid for uid in uids if uid not in canvas_profiles]
+    for uid, canvas_profile in zip(uncached_uids, json_cache.stow_many(canvas.get_user_for_uid, [(uid,) for uid in uncached_uids], max_workers)):
+        canvas_profiles[uid] = canvas_profile
+        # Cache Canvas profiles
+        if app.cache and canvas_profile:
+            app.cache.set('user/{uid}'.format(uid=uid), canvas_profile)
+    return canvas_profiles
 
 
 def get_param(params, key, default_value=None):
     return (params and key in params and params[key]) or default_value
+
+
+def get_limit(params):
+    limit = get_param(params, 'limit', 50)
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 0:
+        raise BadRequestError('Page limit must be a positive integer')
+    return limit
@@ -0,0 +1,93 @@
+import threading
+
+from boac import db
+from boac.lib import stowed_keys
+from boac.lib.cache import LRUCache
+from flask import current_app as app, Response
+import simplejson as json
+from sqlalchemy import text
+
+
+"""Rendered JSON responses for team and saved-cohort pages, held in a per-process LRU cache. Each entry is stored with
+the json_cache keys read while rendering it and a version of the rows behind it: team memberships, the saved cohort and
+its owners, and stowed JSON under those keys. An entry is served only while that version still holds."""
+_cache = None
+_cache_lock = threading.Lock()
+
+"""Row counts and latest update times which change whenever the data behind a page does. A saved cohort's teams are
+read from its filter criteria."""
+_VERSION_SQL = text("""WITH codes AS (
+        SELECT unnest(CAST(:team_codes AS VARCHAR[])) AS code
+        UNION
+        SELECT json_array_elements_text(CAST(filter_criteria AS JSON) -> 'teams') FROM cohort_filters WHERE id = :cohort_id
+    )
+    SELECT
+        (SELECT count(*) FROM team_members WHERE code IN (SELECT code FROM codes)),
+        (SELECT max(updated_at) FROM team_members WHERE code IN (SELECT code FROM codes)),
+        (SELECT updated_at FROM cohort_filters WHERE id = :cohort_id),
+        (SELECT count(*) FROM cohort_filter_owners WHERE cohort_filter_id = :cohort_id),
+        (SELECT count(*) FROM json_cache WHERE key = ANY(CAST(:keys AS VARCHAR[]))),
+        (SELECT max(updated_at) FROM json_cache WHERE key = ANY(CAST(:keys AS VARCHAR[])))""")
+
+
+def cached_response(page, params, load, team_codes=(), cohort_id=None):
+    """Return a JSON response for the given page (such as 'team/FHW') and query params, rendering the result of load()
+    only if no response is cached for the current term whose data is unchanged. That data is the members of the given
+    teams, the given saved cohort and the members of its teams, and any stowed JSON read by load(). Empty results are
+    not cached."""
+    cache = result_cache()
+    if not cache:
+        return Response(_render(load()), mimetype='application/json')
+    key = _key(page, params)
+    entry = cache.get(key)
+    if entry is not None:
+        body, keys, entry_version = entry
+        if version(team_codes, cohort_id, keys) == entry_version:
+            return Response(body, mimetype='application/json')
+    with stowed_keys.recording() as keys:
+        result = load()
+    body = _render(result)
+    if result:
+        keys = sorted(keys)
+        # Loading may itself stow JSON, so the entry is versioned by the data as it stands once loaded.
+        cache.set(key, (body, keys, version(team_codes, cohort_id, keys)))
+    return Response(body, mimetype='application/json')
+
+
+def version(team_codes, cohort_id, keys):
+    """Return a list of row counts and latest update times which changes whenever the given teams' members, saved
+    cohort or stowed JSON keys do."""
+    row = db.session.execute(_VERSION_SQL, {
+        'team_codes': list(team_codes),
+        'cohort_id': cohort_id,
+        'keys': list(keys),
+    }).first()
+    return [str(value) for value in row]
+
+
+def result_cache():
+    """Return this process's cache of rendered results, or False if disabled by configuration."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_entries = app.config['RESULT_CACHE_MAX_ENTRIES']
+                _cache = LRUCache(
+                    max_entries=max_entries,
+                    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+                    ttl=app.config['RESULT_CACHE_TTL'],
+                ) if max_entries else False
+    return _cache
+
+
+def result_cache_stats():
+    cache = result_cache()
+    return cache.stats() if cache else None
+
+
+def _key(page, params):
+    return json.dumps([page, params, app.config['CANVAS_CURRENT_ENROLLMENT_TERM']])
+
+
+def _render(result):
+    return json.dumps(result, ignore_nan=True)
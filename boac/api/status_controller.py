@@ -1,5 +1,7 @@
+from boac.api.result_cache import result_cache_stats
+from boac.models.json_cache import lru_stats
 from flask import current_app as app, jsonify
-from flask_login import current_user
+from flask_login import current_user, login_required
 
 
 @app.route('/api/status')
@@ -15,3 +17,13 @@ def app_status():
         'authenticated_as': authn_state,
     }
     return jsonify(resp)
+
+
+@app.route('/api/status/cache')
+@login_required
+def cache_status():
+    return jsonify({
+        'app_cache': app.cache.stats() if app.cache else None,
+        'json_cache_lru': lru_stats(),
+        'result_cache': result_cache_stats(),
+    })
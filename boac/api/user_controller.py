@@ -3,6 +3,7 @@ import boac.api.util as api_util
 from boac.externals import canvas
 from boac.lib.analytics import merge_analytics_for_user
 from boac.lib.berkeley import sis_term_id_for_name
+from boac.lib.concurrency import run_task_graph
 from boac.lib.http import tolerant_jsonify
 from boac.lib.merged import merge_sis_enrollments, merge_sis_profile
 from boac.models.team_member import TeamMember
@@ -33,38 +34,65 @@ def all_students():
 @app.route('/api/user/<uid>/analytics')
 @login_required
 def user_analytics(uid):
-    canvas_profile = canvas.get_user_for_uid(uid)
+    cohort_data = TeamMember.query.filter_by(member_uid=uid).first()
+
+    # Tasks merge into copies of the course feeds, so that a task still running at the deadline cannot alter the
+    # response.
+    def merge_analytics(canvas_profile, courses_api_feed):
+        courses = [dict(course) for course in courses_api_feed]
+        if canvas_profile:
+            merge_analytics_for_user(courses, canvas_profile['id'])
+        return [course.get('analytics') for course in courses]
+
+    def merge_enrollments(user_courses, courses_api_feed):
+        courses = [dict(course) for course in courses_api_feed]
+        if len(user_courses):
+            term_id = sis_term_id_for_name(user_courses[0].get('term', {}).get('name'))
+            merge_sis_enrollments(courses, cohort_data.member_csid, term_id)
+        return [course.get('sisEnrollments') for course in courses]
+
+    # Fetches that do not depend on one another run concurrently, and the rest start as soon as their inputs are in.
+    tasks = {
+        'canvas_profile': (lambda: canvas.get_user_for_uid(uid), []),
+        'user_courses': (lambda: canvas.get_student_courses_in_term(uid), []),
+        'courses_api_feed': (api_util.canvas_courses_api_feed, ['user_courses']),
+        'analytics': (merge_analytics, ['canvas_profile', 'courses_api_feed']),
+    }
+    if cohort_data:
+        tasks['sis_enrollments'] = (merge_enrollments, ['user_courses', 'courses_api_feed'])
+        tasks['sis_profile'] = (lambda: merge_sis_profile(cohort_data.member_csid), [])
+    results = run_task_graph(tasks, app.config['USER_ANALYTICS_THREADS'], app.config['USER_ANALYTICS_TIMEOUT'])
+
+    canvas_profile = results.get('canvas_profile')
     if canvas_profile is False:
         raise errors.ResourceNotFoundError('No Canvas profile found for user')
     elif not canvas_profile:
         raise errors.InternalServerError('Unable to reach bCourses')
-    canvas_id = canvas_profile['id']
-
-    user_courses = canvas.get_student_courses_in_term(uid)
-    courses_api_feed = api_util.canvas_courses_api_feed(user_courses)
 
-    cohort_data = TeamMember.query.filter_by(member_uid=uid).first()
-    if cohort_data and len(user_courses):
-        term_id = sis_term_id_for_name(user_courses[0].get('term', {}).get('name'))
-        merge_sis_enrollments(courses_api_feed, cohort_data.member_csid, term_id)
-
-    merge_analytics_for_user(courses_api_feed, canvas_id)
-
-    if cohort_data:
-        sis_profile = merge_sis_profile(cohort_data.member_csid)
-        cohort_data = cohort_data.to_api_json()
-    else:
-        sis_profile = False
+    courses_api_feed = results.get('courses_api_feed', [])
+    merge_course_results(courses_api_feed, results.get('analytics'), results.get('sis_enrollments'))
 
     return tolerant_jsonify({
         'uid': uid,
         'canvasProfile': canvas_profile,
-        'cohortData': cohort_data,
+        'cohortData': cohort_data and cohort_data.to_api_json(),
         'courses': courses_api_feed,
-        'sisProfile': sis_profile,
+        'sisProfile': results.get('sis_profile', False),
+        # Data left out because its fetch failed or missed the deadline
+        'incomplete': sorted(name for name in tasks if name not in results),
     })
 
 
+def merge_course_results(courses_api_feed, all_analytics, all_sis_enrollments):
+    for index, course in enumerate(courses_api_feed):
+        if all_analytics:
+            course['analytics'] = all_analytics[index]
+        else:
+            course['analytics'] = {'error': 'Unable to retrieve analytics'}
+        if all_sis_enrollments and all_sis_enrollments[index] is not None:
+            course['sisEnrollments'] = all_sis_enrollments[index]
+
+
 def load_canvas_profile(uid):
     canvas_profile = False
     canvas_response = canvas.get_user_for_uid(uid)
@@ -1,10 +1,12 @@
-from boac.lib import http
+from datetime import timedelta
+
+from boac.lib import concurrency, http
 from boac.lib.mockingbird import fixture
 from boac.models.json_cache import stow
 from flask import current_app as app
 
 
-@stow('canvas_course_sections_{course_id}', for_term=True)
+@stow('canvas_course_sections_{course_id}', for_term=True, ttl=timedelta(days=1))
 def get_course_sections(course_id):
     return _get_course_sections(course_id)
 
@@ -15,7 +17,7 @@ def _get_course_sections(course_id, mock=None):
     return paged_request(path=path, mock=mock)
 
 
-@stow('canvas_user_for_uid_{uid}')
+@stow('canvas_user_for_uid_{uid}', ttl=timedelta(weeks=1))
 def get_user_for_uid(uid):
     """If the user is not found, returns False (which can be cached).
     For any other error response, returns None (which will not be cached).
@@ -24,7 +26,7 @@ def get_user_for_uid(uid):
     if response and hasattr(response, 'json'):
         return response.json()
     else:
-        if hasattr(response, 'raw_response') and response.raw_response.status_code == 404:
+        if getattr(response, 'raw_response', None) is not None and response.raw_response.status_code == 404:
             return False
         else:
             return None
@@ -38,8 +40,12 @@ def _get_user_for_uid(uid, mock=None):
 
 
 def get_student_courses_in_term(uid):
+    return current_term_student_courses(get_all_user_courses(uid))
+
+
+def current_term_student_courses(all_canvas_courses):
+    """Filter a user's course sites to those in the current term in which the user is enrolled as a student."""
     term_name = app.config['CANVAS_CURRENT_ENROLLMENT_TERM']
-    all_canvas_courses = get_all_user_courses(uid)
     # The paged_request wrapper returns either a list of course sites or None to signal HTTP request failure.
     # An empty list should be handled by higher-level logic even though it's falsey.
     if all_canvas_courses is None:
@@ -54,7 +60,7 @@ def get_student_courses_in_term(uid):
     return [course for course in all_canvas_courses if include_course(course)]
 
 
-@stow('canvas_user_courses_{uid}')
+@stow('canvas_user_courses_{uid}', ttl=timedelta(days=1))
 def get_all_user_courses(uid):
     return _get_all_user_courses(uid)
 
@@ -66,7 +72,7 @@ def _get_all_user_courses(uid, mock=None):
     return paged_request(path=path, query=query, mock=mock)
 
 
-@stow('canvas_student_summaries_for_course_{course_id}', for_term=True)
+@stow('canvas_student_summaries_for_course_{course_id}', for_term=True, ttl=timedelta(days=1))
 def get_student_summaries(course_id):
     return _get_student_summaries(course_id)
 
@@ -77,6 +83,17 @@ def _get_student_summaries(course_id, mock=None):
     return paged_request(path=path, mock=mock)
 
 
+def iter_student_summaries(course_id):
+    """Student summaries for a course, page by page; see PagedFeed."""
+    return _iter_student_summaries(course_id)
+
+
+@fixture('canvas_student_summaries_for_course_{course_id}')
+def _iter_student_summaries(course_id, mock=None):
+    path = '/api/v1/courses/{course_id}/analytics/student_summaries'.format(course_id=course_id)
+    return iter_paged(path=path, mock=mock)
+
+
 def build_url(path, query=None):
     working_url = app.config['CANVAS_HTTP_URL'] + path
     return http.build_url(working_url, query)
@@ -84,7 +101,7 @@ def build_url(path, query=None):
 
 def authorized_request(url):
     auth_headers = {'Authorization': 'Bearer {}'.format(app.config['CANVAS_HTTP_TOKEN'])}
-    return http.request(url, auth_headers)
+    return http.request(url, auth_headers, upstream='canvas')
 
 
 def paged_request(path, mock, query=None):
@@ -96,6 +113,21 @@ def paged_request(path, mock, query=None):
         query,
     )
     results = []
+    with mock(url):
+        response = authorized_request(url)
+        if not response:
+            return None
+        results.extend(response.json())
+        # Once the first page tells us how many pages follow, fetch them concurrently.
+        page_urls = http.get_remaining_page_urls(response)
+        if page_urls is not None:
+            pages = concurrency.map_in_app_context(_get_page, page_urls, app.config['CANVAS_PAGE_THREADS'])
+            if None in pages:
+                return None
+            for page in pages:
+                results.extend(page)
+            return results
+        url = http.get_next_page(response)
     while url:
         with mock(url):
             response = authorized_request(url)
@@ -104,3 +136,68 @@ def paged_request(path, mock, query=None):
             results.extend(response.json())
             url = http.get_next_page(response)
     return results
+
+
+def iter_paged(path, mock, query=None):
+    if query is None:
+        query = {}
+    query['per_page'] = 100
+    return PagedFeed(build_url(path, query), mock)
+
+
+class PagedFeed:
+    """Iterate over the items of a paged Canvas feed, fetching pages as iteration proceeds, so that consumers able to
+    stream need not hold the whole feed. As with paged_request, once the first page tells us how many pages follow,
+    they are fetched concurrently, CANVAS_PAGE_THREADS pages at a time. If a page cannot be fetched, iteration stops
+    early and 'failed' is set; callers should check it once done.
+    """
+
+    def __init__(self, url, mock):
+        self.url = url
+        self.mock = mock
+        self.failed = False
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def pages(self):
+        """Iterate over pages, each a list of items, in order."""
+        url = self.url
+        with self.mock(url):
+            response = authorized_request(url)
+            if not response:
+                self.failed = True
+                return
+            page_urls = http.get_remaining_page_urls(response)
+            page = response.json()
+        yield page
+        if page_urls is not None:
+            yield from self._batched_pages(page_urls)
+            return
+        url = http.get_next_page(response)
+        while url:
+            with self.mock(url):
+                response = authorized_request(url)
+                if not response:
+                    self.failed = True
+                    return
+                page = response.json()
+                url = http.get_next_page(response)
+            yield page
+
+    def _batched_pages(self, page_urls):
+        batch_size = max(app.config['CANVAS_PAGE_THREADS'], 1)
+        for batch_start in range(0, len(page_urls), batch_size):
+            with self.mock(self.url):
+                pages = concurrency.map_in_app_context(_get_page, page_urls[batch_start:batch_start + batch_size], batch_size)
+            for page in pages:
+                if page is None:
+                    self.failed = True
+                    return
+                yield page
+
+
+def _get_page(url):
+    response = authorized_request(url)
+    return response.json() if response else None
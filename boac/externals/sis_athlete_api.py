@@ -1,11 +1,13 @@
 """Official access to team memberships"""
 
+from datetime import timedelta
+
 from boac.lib import http
 from boac.models.json_cache import stow
 from flask import current_app as app
 
 
-@stow('athletes_team_{sport}')
+@stow('athletes_team_{sport}', ttl=timedelta(days=1))
 def get_team(sport):
     url = '{url}/sport/{sport}'.format(url=app.config['ATHLETE_API_URL'], sport=sport)
     response = authorized_request(url)
@@ -15,7 +17,7 @@ def get_team(sport):
         return
 
 
-@stow('athletes_sports')
+@stow('athletes_sports', ttl=timedelta(weeks=1))
 def list_sports():
     query = {
         'field-name': 'athleteSport.sport',
@@ -37,4 +39,4 @@ def authorized_request(url):
         'app_key': app.config['ATHLETE_API_KEY'],
         'Accept': 'application/json',
     }
-    return http.request(url, auth_headers)
+    return http.request(url, auth_headers, upstream='sis_athlete_api')
@@ -1,18 +1,20 @@
 """Official access to student enrollment data"""
 
+from datetime import timedelta
+
 from boac.lib import http
 from boac.lib.mockingbird import fixture
 from boac.models.json_cache import stow
 from flask import current_app as app
 
 
-@stow('sis_enrollments_api_{cs_id}_{term_id}', for_term=True)
+@stow('sis_enrollments_api_{cs_id}_{term_id}', for_term=True, ttl=timedelta(days=1))
 def get_enrollments(cs_id, term_id):
     response = _get_enrollments(cs_id, term_id)
     if response and hasattr(response, 'json'):
         return response.json().get('apiResponse', {}).get('response', {})
     else:
-        if hasattr(response, 'raw_response') and response.raw_response.status_code == 404:
+        if getattr(response, 'raw_response', None) is not None and response.raw_response.status_code == 404:
             return False
         else:
             return None
@@ -36,4 +38,4 @@ def authorized_request(url):
         'app_key': app.config['ENROLLMENTS_API_KEY'],
         'Accept': 'application/json',
     }
-    return http.request(url, auth_headers)
+    return http.request(url, auth_headers, upstream='sis_enrollments_api')
@@ -1,12 +1,14 @@
 """Official access to student data"""
 
+from datetime import timedelta
+
 from boac.lib import http
 from boac.lib.mockingbird import fixture
 from boac.models.json_cache import stow
 from flask import current_app as app
 
 
-@stow('sis_student_api_{cs_id}')
+@stow('sis_student_api_{cs_id}', ttl=timedelta(days=1))
 def get_student(cs_id):
     response = _get_student(cs_id)
     if response and hasattr(response, 'json'):
@@ -31,4 +33,4 @@ def authorized_request(url):
         'app_key': app.config['STUDENT_API_KEY'],
         'Accept': 'application/json',
     }
-    return http.request(url, auth_headers)
+    return http.request(url, auth_headers, upstream='sis_student_api')
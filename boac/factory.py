@@ -1,9 +1,9 @@
 from boac import db
 from boac.configs import load_configs
+from boac.lib.cache import cache_from_config
 from boac.logger import initialize_logger
 from boac.routes import register_routes
 from flask import Flask
-from werkzeug.contrib.cache import SimpleCache
 
 
 def create_app():
@@ -22,10 +22,6 @@ def create_app():
 
 
 def initialize_cache(app):
-    """Baby's First Cache."""
-    default = app.config['CACHE_DEFAULT']
-    if default:
-        app.cache = SimpleCache(default_timeout=default)
-    else:
-        app.cache = None
+    """Install the cache backend chosen by CACHE_BACKEND as app.cache, or None if caching is disabled."""
+    app.cache = cache_from_config(app.config)
     return app.cache
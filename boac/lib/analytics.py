@@ -1,22 +1,50 @@
+from datetime import timedelta
 import math
 from statistics import mean
 from boac.externals import canvas
+from boac.models import json_cache
+from boac.models.json_cache import stow
 from flask import current_app as app
-import pandas
+
+
+"""Canvas summary feed columns for each analytics metric"""
+METRIC_COLUMNS = {
+    'assignmentsOnTime': 'on_time',
+    'pageViews': 'page_views',
+    'participations': 'participations',
+}
 
 
 def merge_analytics_for_user(user_courses, canvas_user_id):
-    if user_courses:
-        for course in user_courses:
-            student_summaries = canvas.get_student_summaries(course['canvasCourseId'])
-            if not student_summaries:
+    merge_analytics_for_users([(user_courses, canvas_user_id)])
+
+
+def merge_analytics_for_users(users_courses, max_workers=1):
+    """Given a list of (user_courses, canvas_user_id) pairs, merge analytics into each user's courses. Courses shared
+    by several users are loaded and analyzed once, with up to max_workers courses analyzed concurrently."""
+    course_ids = sorted({course['canvasCourseId'] for user_courses, canvas_user_id in users_courses for course in user_courses or []})
+    analytics_by_course_id = dict(zip(course_ids, json_cache.stow_many(course_analytics, [(course_id,) for course_id in course_ids], max_workers)))
+    for user_courses, canvas_user_id in users_courses:
+        for course in user_courses or []:
+            analytics = analytics_by_course_id[course['canvasCourseId']]
+            if not analytics:
                 course['analytics'] = {'error': 'Unable to retrieve analytics'}
             else:
-                course['analytics'] = analytics_from_summary_feed(student_summaries, canvas_user_id, course)
+                course['analytics'] = student_analytics(analytics, canvas_user_id, course)
 
 
 def mean_course_analytics_for_user(user_courses, canvas_user_id):
-    merge_analytics_for_user(user_courses, canvas_user_id)
+    return mean_course_analytics_for_users([(user_courses, canvas_user_id)])[0]
+
+
+def mean_course_analytics_for_users(users_courses, max_workers=1):
+    """Cohort-wide equivalent of mean_course_analytics_for_user, returning mean analytics in the order of the given
+    (user_courses, canvas_user_id) pairs."""
+    merge_analytics_for_users(users_courses, max_workers)
+    return [mean_percentiles(user_courses) for user_courses, canvas_user_id in users_courses]
+
+
+def mean_percentiles(user_courses):
     meanValues = {}
     for metric in ['assignmentsOnTime', 'pageViews', 'participations']:
         percentiles = []
@@ -32,46 +60,150 @@ def mean_course_analytics_for_user(user_courses, canvas_user_id):
     return meanValues
 
 
+def stow_course_summaries_and_analytics(course_id):
+    """During cache loading, stream a course's student summaries into the cache and build its analytics from the same
+    pass, so that the summaries are neither held in memory whole nor read back to be analyzed. Returns False if the
+    summaries could not be loaded."""
+    summaries_key = canvas.get_student_summaries.stow_key(course_id)
+    if not json_cache.is_due(summaries_key, canvas.get_student_summaries.stow_ttl):
+        return bool(course_analytics(course_id))
+    columns = SummaryColumns()
+    if json_cache.stow_pages(
+        summaries_key,
+        canvas.iter_student_summaries(course_id),
+        canvas.get_student_summaries.stow_ttl,
+        on_page=columns.add,
+    ) is None:
+        return False
+    json_cache.stow_value(course_analytics, [course_id], analytics_for_columns(columns.columns()))
+    return True
+
+
+@stow('analytics_for_course_{course_id}', for_term=True, ttl=timedelta(days=1))
+def course_analytics(course_id):
+    """Precomputed analytics for a course site, built once per course during cache loading and stowed for lookup"""
+    student_summaries = canvas.get_student_summaries(course_id)
+    if not student_summaries:
+        return None
+    return analytics_for_course(student_summaries)
+
+
 def analytics_from_summary_feed(summary_feed, canvas_user_id, canvas_course):
     """Given a student summary feed for a Canvas course, return analytics for a given user"""
-    df = pandas.DataFrame(summary_feed, columns=['id', 'page_views', 'participations', 'tardiness_breakdown'])
-    df.fillna(0, inplace=True)
-    df['on_time'] = df['tardiness_breakdown'].map(lambda t: t['on_time'])
+    return student_analytics(analytics_for_course(summary_feed), canvas_user_id, canvas_course)
+
+
+def analytics_for_course(summary_feed):
+    """Given a student summary feed for a Canvas course, return deciles, mean and standard deviation for each metric,
+    plus an index of every student's raw value, zscore and percentile by Canvas user ID. Missing or undefined values
+    are None, so that the result can be stowed as JSON."""
+    return analytics_for_columns(summary_columns(summary_feed))
+
+
+def analytics_for_columns(columns):
+    """Equivalent of analytics_for_course for a student summary feed already parsed by summary_columns."""
+    # NumPy is needed only to build course analytics, not to look students up in them, so keep it off the import path.
+    import numpy
 
-    student_row = df.loc[df['id'].values == canvas_user_id]
-    if not len(student_row):
+    canvas_user_ids = [str(canvas_user_id) for canvas_user_id in columns['id'].tolist()]
+    analytics = {'students': {canvas_user_id: {} for canvas_user_id in canvas_user_ids}}
+    for metric, column_name in METRIC_COLUMNS.items():
+        column = columns[column_name]
+        if len(column):
+            column_mean = column.mean()
+            column_std = column.std()
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                column_zscores = (column - column_mean) / column_std
+        else:
+            column_mean = column_std = numpy.nan
+            column_zscores = column
+        column_percentiles = zptile(column_zscores)
+        analytics[metric] = {
+            'courseDeciles': [_json_number(q) for q in quantiles(column, 10)],
+            'mean': _json_number(column_mean),
+            'stdDev': _json_number(column_std),
+        }
+        # The first row for a given ID determines that student's values.
+        rows = zip(canvas_user_ids, column.tolist(), column_zscores.tolist(), column_percentiles.tolist())
+        for canvas_user_id, raw, column_zscore, column_percentile in reversed(list(rows)):
+            analytics['students'][canvas_user_id][metric] = {
+                'raw': raw,
+                'zscore': _json_number(column_zscore),
+                'percentile': _json_number(column_percentile),
+            }
+    return analytics
+
+
+def summary_columns(summary_feed):
+    """Parse a student summary feed into one NumPy array per column. As in a DataFrame, a numeric column holding any
+    missing values is floating-point, with those values filled as zero. The feed is read in a single pass and may be
+    any iterable of summaries, such as a canvas.PagedFeed."""
+    columns = SummaryColumns()
+    columns.add(summary_feed)
+    return columns.columns()
+
+
+class SummaryColumns:
+    """Collects the values of each summary_columns column from student summaries added a page at a time, so that the
+    summaries themselves need not be kept."""
+
+    def __init__(self):
+        self.values = {'id': [], 'on_time': [], 'page_views': [], 'participations': []}
+
+    def add(self, summaries):
+        for summary in summaries:
+            self.values['id'].append(summary.get('id'))
+            self.values['on_time'].append((summary.get('tardiness_breakdown') or {}).get('on_time'))
+            self.values['page_views'].append(summary.get('page_views'))
+            self.values['participations'].append(summary.get('participations'))
+
+    def columns(self):
+        import numpy
+
+        def column(column_values):
+            if any(value is None for value in column_values):
+                return numpy.array([value or 0 for value in column_values], dtype=float)
+            return numpy.array(column_values)
+
+        columns = {column_name: column(column_values) for column_name, column_values in self.values.items() if column_name != 'id'}
+        columns['id'] = numpy.array(self.values['id'])
+        return columns
+
+
+def student_analytics(course_analytics, canvas_user_id, canvas_course):
+    """Look up analytics for a given user in precomputed course analytics"""
+    student = course_analytics['students'].get(str(canvas_user_id))
+    if not student:
         canvas_course_id = canvas_course.get('id') or '[None]'
         app.logger.error('Canvas ID {} not found in student summaries for course site {}'.format(canvas_user_id, canvas_course_id))
         return {'error': 'Unable to retrieve analytics'}
 
-    def analytics_for_column(column_name):
-        column_zscore = zscore(df, student_row, column_name)
-        return {
-            'courseDeciles': quantiles(df[column_name], 10),
-            'student': {
-                'raw': student_row[column_name].values[0].item(),
-                'zscore': column_zscore,
-                'percentile': zptile(column_zscore),
-            },
-        }
-
     return {
-        'assignmentsOnTime': analytics_for_column('on_time'),
-        'pageViews': analytics_for_column('page_views'),
-        'participations': analytics_for_column('participations'),
+        metric: {
+            'courseDeciles': course_analytics[metric]['courseDeciles'],
+            'student': student[metric],
+        } for metric in METRIC_COLUMNS
     }
 
 
-def quantiles(series, count):
-    """Return a given number of evenly spaced quantiles for a given series"""
-    return [series.quantile(n / count) for n in range(0, count + 1)]
+def quantiles(values, count):
+    """Return a given number of evenly spaced quantiles for a given array"""
+    import numpy
+
+    if not len(values):
+        return [numpy.nan] * (count + 1)
+    return numpy.quantile(values, numpy.arange(count + 1) / count).tolist()
 
 
 def zptile(z_score):
-    """Derive percentile from zscore"""
-    return 50 * (math.erf(z_score / 2 ** .5) + 1)
+    """Derive percentile from zscore, or from a NumPy array of zscores"""
+    if isinstance(z_score, (int, float)):
+        return 50 * (math.erf(z_score / 2 ** .5) + 1)
+    import numpy
+    return 50 * (numpy.frompyfunc(math.erf, 1, 1)(z_score / 2 ** .5).astype(float) + 1)
 
 
-def zscore(dataframe, row, column_name):
-    """Given a dataframe, an individual row, and column name, return a zscore for the value at that position"""
-    return (row[column_name].values[0] - dataframe[column_name].mean()) / dataframe[column_name].std(ddof=0)
+def _json_number(value):
+    """Convert a numeric value to a native Python number, or None if NaN or infinite."""
+    value = float(value)
+    return value if math.isfinite(value) else None
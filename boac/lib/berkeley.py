@@ -14,3 +14,21 @@ def sis_term_id_for_name(term_name=None):
                 'Fall': '8',
             }
             return '2' + match.group(2) + season_codes[match.group(1)]
+
+
+"""Canvas SIS section IDs for official sections, such as 'SEC:2017-D-12345', carry the section's year, term code and
+CCN. Term codes B, C and D stand for Spring, Summer and Fall."""
+SIS_SECTION_ID_REGEX = re.compile(r'\ASEC:20(\d{2})-([BCD])-(\d{5})')
+
+
+def parse_sis_section_id(sis_section_id=None):
+    """Return a (sis_term_id, ccn) pair for an official section's Canvas SIS section ID, or None."""
+    if sis_section_id:
+        match = SIS_SECTION_ID_REGEX.match(sis_section_id)
+        if match:
+            season_codes = {
+                'B': '2',
+                'C': '5',
+                'D': '8',
+            }
+            return '2' + match.group(1) + season_codes[match.group(2)], match.group(3)
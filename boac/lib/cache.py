@@ -0,0 +1,381 @@
+from collections import OrderedDict
+import hashlib
+import math
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from flask import current_app as app
+import simplejson as json
+
+
+"""Caching utilities. The app cache (app.cache) may be any of the backends here, chosen by CACHE_BACKEND: all share
+get, set, delete and stats methods, and treat a value of None as missing."""
+
+
+def cache_from_config(config):
+    """Return a new cache backend as configured, or None if caching is disabled by CACHE_DEFAULT."""
+    ttl = config['CACHE_DEFAULT']
+    if not ttl:
+        return None
+    backend = config['CACHE_BACKEND']
+    if backend == 'lru':
+        return LRUCache(max_entries=config['CACHE_MAX_ENTRIES'], ttl=ttl)
+    elif backend == 'filesystem':
+        return FileSystemCache(config['CACHE_DIR'], max_entries=config['CACHE_MAX_ENTRIES'], ttl=ttl)
+    elif backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], ttl=ttl)
+    raise ValueError('Unknown CACHE_BACKEND {}'.format(backend))
+
+
+class LRUCache:
+    """A thread-safe, size-bounded cache that evicts least recently used entries once either the entry count or the
+    approximate byte size of stored values exceeds its limit. Entries older than ttl seconds (or a shorter per-entry
+    ttl given to set) are treated as missing.
+
+    Values are stored by reference; callers should treat cached values as read-only.
+    """
+
+    def __init__(self, max_entries, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and time.monotonic() > expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = value_size(value)
+        ttls = [t for t in (self.ttl, ttl) if t is not None]
+        expires_at = time.monotonic() + min(ttls) if ttls else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes and size > self.max_bytes:
+                # A value larger than the whole cache would only evict everything else.
+                return
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def delete_matching(self, predicate):
+        """Delete all entries whose key satisfies the predicate. Returns the number of entries deleted."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _remove(self, key):
+        value, size, expires_at = self._entries.pop(key)
+        self._bytes -= size
+
+
+def value_size(value):
+    """Approximate the memory held by a JSON-compatible value as the length of its serialized form."""
+    return len(json.dumps(value, ignore_nan=True))
+
+
+class FileSystemCache:
+    """A cache shared by all worker processes on a host, storing each JSON-compatible value in its own file under a
+    directory. Writes are atomic. Rather than scan the directory on every write, each process prunes it after every
+    tenth of max_entries writes, evicting the least recently written files down to that many writes short of the
+    limit. Should the file system fail, reads miss and writes are dropped, as with RedisCache. Hit, miss, error and
+    eviction counts are kept per process."""
+
+    suffix = '.json'
+
+    def __init__(self, directory, max_entries, ttl=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_interval = max(1, max_entries // 10)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        self.expirations = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                expires_at = float(file.readline())
+                value = json.load(file)
+        except FileNotFoundError:
+            self._count('misses')
+            return default
+        except (OSError, ValueError) as e:
+            self._error('read', e)
+            self._count('misses')
+            return default
+        if expires_at and time.time() > expires_at:
+            self._remove(path)
+            self._count('expirations')
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttls = [t for t in (self.ttl, ttl) if t is not None]
+        expires_at = time.time() + min(ttls) if ttls else 0
+        temp_path = None
+        try:
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as file:
+                file.write('{}\n'.format(expires_at))
+                json.dump(value, file, ignore_nan=True)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            if temp_path:
+                self._remove(temp_path)
+            self._error('write', e)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.prune_interval == 0
+        if due:
+            self._prune()
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    def stats(self):
+        try:
+            entry_count = len(self._entries())
+        except OSError:
+            entry_count = None
+        with self._lock:
+            return {
+                'entries': entry_count,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + self.suffix)
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(self.suffix)]
+
+    def _prune(self):
+        try:
+            entries = self._entries()
+        except OSError as e:
+            self._error('prune', e)
+            return
+        excess = len(entries) - (self.max_entries - self.prune_interval + 1)
+        if excess > 0:
+            for entry in sorted(entries, key=_modified_time)[:excess]:
+                if self._remove(entry.path):
+                    self._count('evictions')
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _error(self, operation, error):
+        self._count('errors')
+        app.logger.warning('File system cache {} failed: {}'.format(operation, error))
+
+    @staticmethod
+    def _remove(path):
+        """Remove a file if another process has not already done so, returning True if this call removed it."""
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+def _modified_time(entry):
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return 0
+
+
+class RedisError(Exception):
+    """An error reply from a Redis server."""
+
+
+class RedisCache:
+    """A cache shared by all worker processes and hosts using a Redis server (or anything speaking its protocol),
+    at a URL such as redis://localhost:6379/0. Values are stored as JSON under key_prefix, and evicted according to
+    the server's maxmemory policy. Should the server be unreachable, reads miss and writes are dropped, so that the
+    app carries on without its cache. Hit and miss counts are kept per process; evictions are the server's."""
+
+    def __init__(self, url, ttl=None, key_prefix='boac:', socket_timeout=1):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.socket_timeout = socket_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key, default=None):
+        reply = self._command_or_none('GET', self.key_prefix + key)
+        if reply is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return json.loads(reply.decode('utf-8'))
+
+    def set(self, key, value, ttl=None):
+        ttls = [t for t in (self.ttl, ttl) if t is not None]
+        command = ['SET', self.key_prefix + key, json.dumps(value, ignore_nan=True)]
+        if ttls:
+            command += ['EX', max(math.ceil(min(ttls)), 1)]
+        self._command_or_none(*command)
+
+    def delete(self, key):
+        self._command_or_none('DEL', self.key_prefix + key)
+
+    def stats(self):
+        info = self._command_or_none('INFO', 'stats')
+        server_stats = dict(
+            line.split(':', 1) for line in (info or b'').decode('utf-8').splitlines() if ':' in line
+        )
+        evictions = server_stats.get('evicted_keys')
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'evictions': int(evictions) if evictions is not None else None,
+            }
+
+    def command(self, *args):
+        """Send a command on this thread's connection and return the reply, reconnecting if need be."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+        try:
+            connection.sendall(_encode_command(args))
+            return _read_reply(self._local.reader)
+        except OSError:
+            self._disconnect()
+            raise
+
+    def _command_or_none(self, *args):
+        try:
+            return self.command(*args)
+        except (OSError, RedisError) as e:
+            self._count('errors')
+            app.logger.warning('Redis cache command {} failed: {}'.format(args[0], e))
+            return None
+
+    def _connect(self):
+        connection = socket.create_connection((self.host, self.port), timeout=self.socket_timeout)
+        self._local.connection = connection
+        self._local.reader = connection.makefile('rb')
+        if self.db:
+            self.command('SELECT', self.db)
+        return connection
+
+    def _disconnect(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            self._local.reader.close()
+            connection.close()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def _encode_command(args):
+    encoded = [b'*' + str(len(args)).encode() + b'\r\n']
+    for arg in args:
+        arg = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        encoded.append(b'$' + str(len(arg)).encode() + b'\r\n' + arg + b'\r\n')
+    return b''.join(encoded)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('Connection closed by Redis server')
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b'+':
+        return rest
+    elif prefix == b'-':
+        raise RedisError(rest.decode('utf-8'))
+    elif prefix == b':':
+        return int(rest)
+    elif prefix == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        return reader.read(length + 2)[:-2]
+    elif prefix == b'*':
+        length = int(rest)
+        if length < 0:
+            return None
+        return [_read_reply(reader) for n in range(length)]
+    raise ConnectionError('Unexpected reply from Redis server: {}'.format(line))
@@ -0,0 +1,174 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+
+from boac import db
+from boac.lib import deadline, stowed_keys
+from flask import current_app as app
+from sqlalchemy.engine import Connection
+
+
+"""Helpers to run work on bounded thread pools, and to coalesce concurrent duplicate work. Pooled tasks run in their
+own Flask app context, and therefore in their own thread-scoped DB session, under the caller's deadline if any (see
+boac.lib.deadline). Stowed JSON keys they read are recorded for the caller (see boac.lib.stowed_keys). Where the DB
+session is bound to a single Connection, as in tests that roll back their transaction, threads would share that
+Connection, which is not thread-safe; work then runs serially instead."""
+
+
+def map_in_app_context(func, items, max_workers):
+    """Apply func to each item, using up to max_workers threads. Results are returned in item order.
+    With a single worker (or a single item) the calls run serially in the current thread and context.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1 or _session_bound_to_connection():
+        return [func(item) for item in items]
+
+    _app = app._get_current_object()
+    _deadline = deadline.current()
+    _recorder = stowed_keys.current()
+
+    def _call_in_app_context(item):
+        with _app.app_context(), deadline.at(_deadline), stowed_keys.at(_recorder):
+            return func(item)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_call_in_app_context, items))
+
+
+def submit_in_app_context(executor, func, *args, **kw):
+    """Submit func to an executor, to be run in a fresh app context. Exceptions are logged rather than raised."""
+    _app = app._get_current_object()
+
+    def _call_in_app_context():
+        with _app.app_context():
+            try:
+                return func(*args, **kw)
+            except Exception as e:
+                _app.logger.exception(e)
+
+    return executor.submit(_call_in_app_context)
+
+
+def run_task_graph(tasks, max_workers, timeout):
+    """Run named tasks, each as soon as the tasks it depends on have completed, using up to max_workers threads.
+    tasks maps each name to a (func, dependencies) pair; func is called with the results of the named dependencies,
+    in order. Returns a dict of results by name for the tasks that completed within timeout seconds. Tasks that raise
+    an exception, that are unfinished at the deadline, or that depend on such tasks are left out of the results, so
+    that callers can make do with partial results. With a single worker the tasks run serially in the current thread
+    and context, and no new task starts after the deadline.
+    """
+    return _TaskGraph(tasks, timeout).run(1 if _session_bound_to_connection() else max_workers)
+
+
+def _session_bound_to_connection():
+    return isinstance(db.session.bind, Connection)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key, so that only the first caller runs the function and the others wait
+    for and share its result (or exception)."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kw):
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+        if not is_leader:
+            flight.done.wait()
+            if flight.exception:
+                raise flight.exception
+            return flight.result
+        try:
+            flight.result = func(*args, **kw)
+            return flight.result
+        except Exception as e:
+            flight.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+class _TaskGraph:
+    def __init__(self, tasks, timeout):
+        self.app = app._get_current_object()
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.outer_deadline = deadline.current()
+        self.recorder = stowed_keys.current()
+        self.remaining = dict(tasks)
+        self.results = {}
+        self.failed = set()
+        self.running = {}
+
+    def run(self, max_workers):
+        executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+        try:
+            while (self.remaining or self.running) and time.monotonic() < self.deadline:
+                started = self._start_ready_tasks(executor)
+                if self.running:
+                    self._wait_for_running()
+                elif not started:
+                    break
+        finally:
+            if executor:
+                for future in self.running:
+                    future.cancel()
+                executor.shutdown(wait=False)
+        incomplete = sorted(set(self.remaining) | set(self.running.values()))
+        if incomplete:
+            self.app.logger.warning('Tasks incomplete after {} seconds: {}'.format(self.timeout, ', '.join(incomplete)))
+        return self.results
+
+    def _start_ready_tasks(self, executor):
+        started = False
+        for name, (func, dependencies) in list(self.remaining.items()):
+            if time.monotonic() >= self.deadline:
+                break
+            if any(dependency in self.failed for dependency in dependencies):
+                del self.remaining[name]
+                self.failed.add(name)
+            elif all(dependency in self.results for dependency in dependencies):
+                del self.remaining[name]
+                args = [self.results[dependency] for dependency in dependencies]
+                if executor:
+                    self.running[executor.submit(self._call_in_app_context, func, *args)] = name
+                else:
+                    self._record(name, lambda: self._call_within_deadline(func, *args))
+                started = True
+        return started
+
+    def _wait_for_running(self):
+        done, not_done = wait(self.running, timeout=max(self.deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            self._record(self.running.pop(future), future.result)
+
+    def _call_in_app_context(self, func, *args):
+        with self.app.app_context(), stowed_keys.at(self.recorder):
+            return self._call_within_deadline(func, *args)
+
+    def _call_within_deadline(self, func, *args):
+        # Outbound requests made by tasks are cut short by the graph's timeout, or by any earlier deadline set by the
+        # caller.
+        with deadline.at(self.outer_deadline), deadline.at(self.deadline):
+            return func(*args)
+
+    def _record(self, name, call):
+        try:
+            self.results[name] = call()
+        except Exception as e:
+            self.app.logger.exception(e)
+            self.failed.add(name)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+import threading
+import time
+
+
+"""Request-scoped deadlines. While handling an API request, outbound HTTP requests are cut short once the request's
+time budget is spent, and the concurrency helpers carry the deadline into their worker threads. Deadlines are
+absolute times on the time.monotonic() clock, held per thread."""
+
+_local = threading.local()
+
+
+def current():
+    """Return the deadline in effect for this thread, or None."""
+    return getattr(_local, 'deadline', None)
+
+
+def remaining():
+    """Return the seconds left before the current deadline (possibly negative), or None if there is no deadline."""
+    deadline = current()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def start(seconds):
+    """Set a deadline the given number of seconds from now, replacing any other. For use where a context manager
+    does not fit, such as Flask request hooks; pair with clear."""
+    _local.deadline = time.monotonic() + seconds if seconds else None
+
+
+def clear():
+    _local.deadline = None
+
+
+@contextmanager
+def limit(seconds):
+    """Within this block, work must be done within the given number of seconds, or by any earlier deadline."""
+    with at(time.monotonic() + seconds):
+        yield
+
+
+@contextmanager
+def at(deadline):
+    """Within this block, apply an absolute deadline such as one returned by current() in another thread. An earlier
+    deadline already in effect still applies; None adds no deadline."""
+    previous = current()
+    if deadline is not None and (previous is None or deadline < previous):
+        _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
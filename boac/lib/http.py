@@ -1,11 +1,40 @@
+from datetime import datetime, timezone
+import email.utils
+import random
+import threading
+import time
 import urllib
 
+from boac.lib import deadline
+from boac.lib.rate_limit import TokenBucket
 from flask import current_app as app
 from flask import Response
 import requests
 import simplejson as json
 
 
+# Pooled sessions keyed by scheme and host, so that calls to the same upstream reuse keep-alive connections.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Caps on simultaneous in-flight requests, keyed by upstream name and shared by all threads in this process.
+_upstream_semaphores = {}
+
+# Token buckets limiting request rates, keyed by upstream name and shared by all threads in this process.
+_rate_limiters = {}
+
+# Floor in seconds for timeouts cut down to fit a deadline.
+MIN_TIMEOUT = 0.001
+
+# Request, retry and failure counts, keyed by upstream name.
+_upstream_stats = {}
+_stats_lock = threading.Lock()
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The request deadline passed before a request could be sent or completed."""
+
+
 class ResponseExceptionWrapper:
     def __init__(self, exception, original_response=None):
         self.exception = exception
@@ -35,27 +64,274 @@ def get_next_page(response):
         return None
 
 
-def request(url, headers):
+def get_remaining_page_urls(response):
+    """If a paged response links to its last page by page number, return the URLs of the pages following it, in order.
+    Otherwise (for example, if the API pages by opaque bookmarks) return None."""
+    if not (response.links and 'last' in response.links):
+        return None
+    last_url = urllib.parse.urlparse(response.links['last'].get('url'))
+    last_query = urllib.parse.parse_qs(last_url.query)
+    current_query = urllib.parse.parse_qs(urllib.parse.urlparse(response.url).query)
+    try:
+        last_page = int(last_query['page'][0])
+        current_page = int(current_query.get('page', ['1'])[0])
+    except (KeyError, ValueError):
+        return None
+    urls = []
+    for page in range(current_page + 1, last_page + 1):
+        last_query['page'] = [str(page)]
+        urls.append(urllib.parse.urlunparse(last_url._replace(query=urllib.parse.urlencode(last_query, doseq=True))))
+    return urls
+
+
+def request(url, headers, upstream=None):
     """
-    Exception and error catching wrapper for outgoing HTTP requests.
+    Exception and error catching wrapper for outgoing HTTP requests. Connection errors, server errors and rate limiting
+    are retried up to HTTP_RETRIES times, after an exponential backoff with jitter or as directed by Retry-After.
+    Requests time out per HTTP_TIMEOUTS, and no request or retry outlasts the current deadline (see boac.lib.deadline).
     :param url:
     :param headers:
+    :param upstream: Name of the external API, used to apply per-upstream limits (see HTTP_UPSTREAM_CONCURRENCY) and
+        to count requests and retries (see upstream_stats).
     :return: The HTTP response from the external server, if the request was successful.
         Otherwise, a wrapper containing the exception and the original HTTP response, if
         one was returned.
         Borrowing the Requests convention, successful responses are truthy and failures are falsey.
     """
     app.logger.debug({'message': 'HTTP request', 'url': url, 'headers': sanitize_headers(headers)})
+    stats_key = upstream or _host(url)
+    retries = app.config['HTTP_RETRIES']
+    attempt = 0
+    while True:
+        time_remaining = deadline.remaining()
+        if time_remaining is not None and time_remaining <= 0:
+            response, exception = None, DeadlineExceeded('Deadline passed before request to {}'.format(url))
+            break
+        _count(stats_key, 'requests')
+        response, exception = _attempt_request(url, headers, upstream)
+        if exception is None:
+            return response
+        if isinstance(exception, DeadlineExceeded):
+            break
+        delay = _retry_delay(response, attempt) if attempt < retries else None
+        time_remaining = deadline.remaining()
+        if delay is None or (time_remaining is not None and delay >= time_remaining):
+            break
+        _count(stats_key, 'retries')
+        app.logger.warning('Will retry in {:.2f} seconds: {}'.format(delay, exception))
+        time.sleep(delay)
+        attempt += 1
+    _count(stats_key, 'failures')
+    app.logger.error(exception)
+    return ResponseExceptionWrapper(exception, response)
+
+
+def upstream_stats():
+    """Report, per upstream (or host, for requests not naming an upstream), counts of requests sent, retries, failures
+    returned to callers, responses signalling a rate limit, and requests held back by our own rate limiter."""
+    with _stats_lock:
+        return {key: dict(stats) for key, stats in _upstream_stats.items()}
+
+
+def _attempt_request(url, headers, upstream):
+    """Send one request, first waiting for our rate limit and concurrency limit, but no longer than the current deadline
+    allows. Returns a (response, exception) pair."""
     response = None
+    rate_limiter = _rate_limiter(upstream)
+    semaphore = _upstream_semaphore(upstream)
+    exception = _wait_for_turn(url, upstream, rate_limiter, semaphore)
+    if exception:
+        return None, exception
     try:
+        # Waiting our turn may itself have used up the time remaining.
+        time_remaining = deadline.remaining()
+        if time_remaining is not None and time_remaining <= 0:
+            return None, DeadlineExceeded('Deadline passed waiting to request {}'.format(url))
         # TODO handle methods other than GET
-        response = requests.get(url, headers=headers)
+        response = get_session(url).get(url, headers=headers, timeout=_timeout(upstream, time_remaining))
+        if rate_limiter:
+            _adapt_rate(rate_limiter, response)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
-        app.logger.error(e)
-        return ResponseExceptionWrapper(e, response)
+        if response is not None and is_rate_limited(response):
+            _count(upstream or _host(url), 'rate_limited')
+        return response, e
     else:
-        return response
+        return response, None
+    finally:
+        if semaphore:
+            semaphore.release()
+
+
+def _wait_for_turn(url, upstream, rate_limiter, semaphore):
+    """Take a rate limit token and then a concurrency slot, as configured for the upstream. Returns DeadlineExceeded,
+    holding neither, if the deadline would pass first."""
+    if rate_limiter:
+        try:
+            waited = rate_limiter.acquire(timeout=deadline.remaining())
+        except TimeoutError:
+            return DeadlineExceeded('Deadline would pass waiting on rate limit for {}'.format(url))
+        if waited:
+            _count(upstream, 'rate_limit_waits')
+    # Hold the upstream's concurrency slot only while the request is in flight, not while backing off.
+    if semaphore:
+        time_remaining = deadline.remaining()
+        if not semaphore.acquire(timeout=max(time_remaining, 0) if time_remaining is not None else None):
+            return DeadlineExceeded('Deadline passed waiting on concurrency limit for {}'.format(url))
+    return None
+
+
+def _timeout(upstream, time_remaining=None):
+    """Return (connect, read) timeouts for an upstream, cut down to fit within the time remaining if need be. Timeouts
+    are never cut below MIN_TIMEOUT, since requests rejects timeouts that are not positive."""
+    timeouts = app.config['HTTP_TIMEOUTS']
+    connect_timeout, read_timeout = timeouts.get(upstream) or timeouts['default']
+    if time_remaining is not None:
+        connect_timeout = max(min(connect_timeout, time_remaining), MIN_TIMEOUT)
+        read_timeout = max(min(read_timeout, time_remaining), MIN_TIMEOUT)
+    return connect_timeout, read_timeout
+
+
+def _adapt_rate(rate_limiter, response):
+    remaining = response.headers.get('X-Rate-Limit-Remaining')
+    if remaining is not None:
+        try:
+            rate_limiter.adapt(float(remaining))
+        except ValueError:
+            pass
+
+
+def is_rate_limited(response):
+    """Canvas signals throttling with 403 Forbidden (Rate Limit Exceeded) and an exhausted X-Rate-Limit-Remaining;
+    other APIs with 429 Too Many Requests."""
+    if response.status_code == 429:
+        return True
+    if response.status_code == 403:
+        remaining = response.headers.get('X-Rate-Limit-Remaining')
+        try:
+            if remaining is not None and float(remaining) <= 0:
+                return True
+        except ValueError:
+            pass
+        return 'Rate Limit Exceeded' in (response.text or '')
+    return False
+
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before retrying a failed request, or None if it should not be retried."""
+    if response is not None:
+        if not (response.status_code >= 500 or is_rate_limited(response)):
+            # Other client errors will not go away on retry.
+            return None
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            # Rather than wait longer than we would ever back off, give up.
+            return retry_after if retry_after <= app.config['HTTP_RETRY_MAX_DELAY'] else None
+    # Exponential backoff with full jitter, so that clients failing together do not retry in lockstep.
+    backoff = min(app.config['HTTP_RETRY_BACKOFF'] * 2 ** attempt, app.config['HTTP_RETRY_MAX_DELAY'])
+    return random.uniform(0, backoff)
+
+
+def _retry_after(response):
+    """Parse a Retry-After header, given either as seconds or as an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+def _count(stats_key, counter):
+    with _stats_lock:
+        stats = _upstream_stats.setdefault(stats_key, {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'rate_limited': 0,
+            'rate_limit_waits': 0,
+        })
+        stats[counter] += 1
+
+
+def _host(url):
+    url_components = urllib.parse.urlparse(url)
+    return '{}://{}'.format(url_components.scheme, url_components.netloc)
+
+
+def get_session(url):
+    """Return the pooled session for the scheme and host of a URL, creating it on first use."""
+    host = _host(url)
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if not session:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=app.config['HTTP_POOL_MAXSIZE'],
+                pool_block=app.config['HTTP_POOL_BLOCK'],
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+
+def connection_stats():
+    """Report, per upstream host, how many connections were opened and how many requests reused an open connection."""
+    stats = {}
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    for host, session in sessions:
+        opened = 0
+        requested = 0
+        # Both schemes are mounted to a single adapter.
+        pools = session.get_adapter(host).poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool:
+                opened += pool.num_connections
+                requested += pool.num_requests
+        stats[host] = {
+            'opened': opened,
+            'requests': requested,
+            'reused': max(requested - opened, 0),
+        }
+    return stats
+
+
+def _upstream_semaphore(upstream):
+    limit = upstream and app.config['HTTP_UPSTREAM_CONCURRENCY'].get(upstream)
+    if not limit:
+        return None
+    with _sessions_lock:
+        if upstream not in _upstream_semaphores:
+            _upstream_semaphores[upstream] = threading.BoundedSemaphore(limit)
+        return _upstream_semaphores[upstream]
+
+
+def _rate_limiter(upstream):
+    limits = upstream and app.config['HTTP_UPSTREAM_RATE_LIMITS'].get(upstream)
+    if not limits:
+        return None
+    with _sessions_lock:
+        rate_limiter = _rate_limiters.get(upstream)
+        # Limits are read once per upstream, unless configuration has since changed.
+        if not rate_limiter or (rate_limiter.rate, rate_limiter.burst, rate_limiter.low_water) != _limit_values(limits):
+            rate_limiter = _rate_limiters[upstream] = TokenBucket(*_limit_values(limits))
+        return rate_limiter
+
+
+def _limit_values(limits):
+    return limits['rate'], limits.get('burst', 1), limits.get('low_water')
 
 
 def sanitize_headers(headers):
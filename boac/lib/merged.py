@@ -1,12 +1,18 @@
-import re
+from collections import OrderedDict
 
 from boac import db
 import boac.api.util as api_util
 from boac.externals import calnet, canvas, sis_enrollments_api, sis_student_api
+from boac.lib import berkeley
+from boac.models import json_cache
+from boac.models.section_crosswalk import SectionCrosswalk
 from boac.models.team_member import TeamMember
 
 
-def merge_sis_enrollments(canvas_course_sites, cs_id, term_id):
+def merge_sis_enrollments(canvas_course_sites, cs_id, term_id, ccns_by_site_id=None):
+    """Merge a student's SIS enrollments into the Canvas course sites whose sections they match, by CCN. Callers
+    merging enrollments for many students may pass a shared ccns_by_site_id index from section_ccn_index, covering at
+    least the given sites, so that the index is looked up only once."""
     # TODO For the moment, we're returning Canvas courses only for the current term as defined in
     # app config. Once we start grabbing multiple terms, we'll need additional sorting logic.
     enrollments = sis_enrollments_api.get_enrollments(cs_id, term_id)
@@ -15,25 +21,53 @@ def merge_sis_enrollments(canvas_course_sites, cs_id, term_id):
     else:
         return
 
+    if ccns_by_site_id is None:
+        ccns_by_site_id = section_ccn_index(canvas_course_sites, term_id)
+    merge_enrollments_by_ccn(canvas_course_sites, ccns_by_site_id, enrollment_ccn_index(enrollments))
+
+
+def merge_enrollments_by_ccn(canvas_course_sites, ccns_by_site_id, enrollments_by_ccn):
     for site in canvas_course_sites:
         site['sisEnrollments'] = []
-        sections = canvas.get_course_sections(site['canvasCourseId'])
-        if not sections:
-            continue
-        for section in sections:
-            # Manually created site sections will have no integration ID.
-            canvas_sis_section_id = section.get('sis_section_id') or ''
-            ccn_match = re.match(r'\ASEC:20\d{2}-[BCD]-(\d{5})', canvas_sis_section_id)
-            if not ccn_match:
-                continue
-            canvas_ccn = ccn_match.group(1)
-            if not canvas_ccn:
-                continue
-            for enrollment in enrollments:
-                sis_ccn = str(enrollment.get('classSection', {}).get('id'))
-                if canvas_ccn == sis_ccn:
-                    site['sisEnrollments'].append(api_util.sis_enrollment_api_feed(enrollment))
-                    break
+        for ccn in ccns_by_site_id.get(site['canvasCourseId']) or []:
+            enrollment = enrollments_by_ccn.get(ccn)
+            if enrollment:
+                site['sisEnrollments'].append(api_util.sis_enrollment_api_feed(enrollment))
+
+
+def section_ccn_index(canvas_course_sites, sis_term_id=None):
+    """Return a dict of official section CCNs, in section order, by Canvas course ID, optionally limited to sections
+    in one SIS term. CCNs come from the section crosswalk built while loading the cache; only sites missing from the
+    crosswalk fall back to Canvas section feeds. A site whose sections cannot be loaded maps to None."""
+    site_ids = list(OrderedDict.fromkeys(site['canvasCourseId'] for site in canvas_course_sites))
+    ccns_by_site_id = SectionCrosswalk.ccns_for_courses(site_ids, sis_term_id)
+    uncrossed_site_ids = [site_id for site_id in site_ids if site_id not in ccns_by_site_id]
+    all_sections = json_cache.stow_many(canvas.get_course_sections, [(site_id,) for site_id in uncrossed_site_ids])
+    for site_id, sections in zip(uncrossed_site_ids, all_sections):
+        ccns_by_site_id[site_id] = sections and section_ccns(sections, sis_term_id)
+    return ccns_by_site_id
+
+
+def section_ccns(sections, sis_term_id=None):
+    """Return the CCNs of those Canvas sections with SIS integration IDs, optionally limited to one SIS term. Manually
+    created sections have none."""
+    if sis_term_id is not None:
+        sis_term_id = str(sis_term_id)
+    ccns = []
+    for section in sections:
+        term_and_ccn = berkeley.parse_sis_section_id(section.get('sis_section_id'))
+        if term_and_ccn and (sis_term_id is None or term_and_ccn[0] == sis_term_id):
+            ccns.append(term_and_ccn[1])
+    return ccns
+
+
+def enrollment_ccn_index(enrollments):
+    """Return a dict of SIS enrollments by the CCN of their class section. Should a CCN recur, the first enrollment
+    wins."""
+    enrollments_by_ccn = {}
+    for enrollment in enrollments:
+        enrollments_by_ccn.setdefault(str(enrollment.get('classSection', {}).get('id')), enrollment)
+    return enrollments_by_ccn
 
 
 def merge_sis_profile(csid):
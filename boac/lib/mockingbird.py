@@ -3,6 +3,7 @@ from functools import partial, wraps
 import inspect
 import json
 import os
+import threading
 import urllib
 
 from flask import current_app as app
@@ -41,6 +42,16 @@ class MockResponse:
 in a last-in-first-out queue so that test code can temporarily substitute custom mocks."""
 _mock_registry = {}
 
+"""httpretty patches sockets globally, so mocks activated from concurrent threads share a single enabled state. It is
+disabled only when the last active mock exits."""
+_activation_lock = threading.Lock()
+_active_mock_count = 0
+
+"""Mock responses by URL, in a last-in-first-out queue per URL. httpretty would serve each response registered for a URL
+in turn, so that a retried request gets whatever was registered before; instead, each URL is registered once with a
+callback serving its latest response. A URL keeps its last response until httpretty is disabled."""
+_url_responses = {}
+
 
 def _register_mock(request_function, response_function):
     _mock_registry[request_function.__name__].append(response_function)
@@ -167,7 +178,8 @@ def response_from_paged_fixture(pattern):
       - some_resource_page_1.json
       - some_resource_page_2.json
     etc.
-    Fixtures will be returned with a 200 status, and will include a "next" link header as long as another page exists.
+    Fixtures will be returned with a 200 status, and will include a "next" link header as long as another page exists,
+    as well as a "last" link header.
     If no matching fixtures are found, return a generic 404.
 
     Usage:
@@ -186,13 +198,11 @@ def response_from_paged_fixture(pattern):
         with file:
             fixture = file.read()
 
-        headers = {}
-        next_fixture_file = fixtures_path + '/{}_page_{}.json'.format(pattern, page + 1)
-        if os.path.isfile(next_fixture_file):
+        def page_url(page_number):
             parsed_url = urllib.parse.urlparse(uri)
             parsed_query = urllib.parse.parse_qs(parsed_url.query)
-            parsed_query['page'] = page + 1
-            next_url = urllib.parse.urlunparse([
+            parsed_query['page'] = page_number
+            return urllib.parse.urlunparse([
                 parsed_url.scheme,
                 parsed_url.netloc,
                 parsed_url.path,
@@ -200,7 +210,15 @@ def response_from_paged_fixture(pattern):
                 urllib.parse.urlencode(parsed_query, doseq=True),
                 '',
             ])
-            headers['Link'] = '<{}>; rel="next"'.format(next_url)
+
+        last_page = page
+        while os.path.isfile(fixtures_path + '/{}_page_{}.json'.format(pattern, last_page + 1)):
+            last_page += 1
+        links = []
+        if last_page > page:
+            links.append('<{}>; rel="next"'.format(page_url(page + 1)))
+        links.append('<{}>; rel="last"'.format(page_url(last_page)))
+        headers = {'Link': ', '.join(links)}
         return (200, headers, fixture)
     # The fixtures path is based on app config and for obscure scoping reasons needs to be passed in as a partial;
     # otherwise Flask will see it as an attempt to evaluate app config outside an application context.
@@ -226,16 +244,39 @@ def register_mock(request_function, response):
 
 @contextmanager
 def _activate_mock(url, mock_response):
+    global _active_mock_count
     if mock_response and _environment_supports_mocks():
-        httpretty.enable()
-        # TODO handle methods other than GET
-        httpretty.register_uri(httpretty.GET, url, body=mock_response)
-        yield
-        httpretty.disable()
+        with _activation_lock:
+            if not _active_mock_count:
+                httpretty.enable()
+            _active_mock_count += 1
+            if url not in _url_responses:
+                _url_responses[url] = []
+                # TODO handle methods other than GET
+                httpretty.register_uri(httpretty.GET, url, body=partial(_serve_latest_response, url))
+            _url_responses[url].append(mock_response)
+        try:
+            yield
+        finally:
+            with _activation_lock:
+                _active_mock_count -= 1
+                responses = _url_responses[url]
+                if len(responses) > 1:
+                    responses.remove(mock_response)
+                if not _active_mock_count:
+                    httpretty.disable()
+                    httpretty.reset()
+                    _url_responses.clear()
     else:
         yield
 
 
+def _serve_latest_response(url, request, uri, headers):
+    with _activation_lock:
+        mock_response = _url_responses[url][-1]
+    return mock_response(request, uri, headers)
+
+
 # It would be nicer to use a MOCKS_ENABLED config value rather than a hardcoded list of environments, but tests are
 # currently set up such that this code is loaded before app config is in place.
 def _environment_supports_mocks():
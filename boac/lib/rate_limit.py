@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+"""Client-side rate limiting, to keep bursts of requests from this process within upstream API quotas."""
+
+
+class TokenBucket:
+    """A thread-safe token bucket, refilled at rate tokens per second up to burst tokens. Callers take one token per
+    request, waiting their turn when the bucket is empty; tokens are reserved under the lock, so that waiting callers
+    are served in order rather than racing for each new token.
+
+    The refill rate may be scaled down with adapt, for upstreams that report how much of their own quota remains.
+    """
+
+    # However low an upstream's remaining quota, keep trickling requests at this fraction of the configured rate.
+    MIN_RATE_FACTOR = 0.1
+
+    def __init__(self, rate, burst, low_water=None):
+        self.rate = rate
+        self.burst = burst
+        self.low_water = low_water
+        self.rate_factor = 1.0
+        self.tokens = burst
+        self.waits = 0
+        self.waited = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take a token, sleeping until one is available. Returns the number of seconds waited. If no token would be
+        available within timeout seconds, raises TimeoutError at once, without taking a token or sleeping."""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / (self.rate * self.rate_factor) if self.tokens < 0 else 0
+            if timeout is not None and wait > timeout:
+                self.tokens += 1
+                raise TimeoutError('Rate limit token not available within {:.2f} seconds'.format(timeout))
+            if wait:
+                self.waits += 1
+                self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def adapt(self, remaining):
+        """Given the quota an upstream reports remaining, slow down in proportion as it falls below low_water, and
+        return to full rate once it recovers."""
+        if not self.low_water:
+            return
+        with self._lock:
+            self._refill()
+            if remaining >= self.low_water:
+                self.rate_factor = 1.0
+            else:
+                self.rate_factor = max(remaining / self.low_water, self.MIN_RATE_FACTOR)
+                # Spend no saved-up burst while the upstream is short.
+                self.tokens = min(self.tokens, 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate_factor': self.rate_factor,
+                'waits': self.waits,
+                'waited': self.waited,
+            }
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate * self.rate_factor)
+        self._updated_at = now
@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+import threading
+
+
+"""Records of the json_cache keys read while building a result, so that a cached rendering of the result can later be
+checked against just those rows. Recorders are held per thread, and the concurrency helpers carry them into their
+worker threads, as with deadlines."""
+
+_local = threading.local()
+# Worker threads may record into the same set at once.
+_lock = threading.Lock()
+
+
+def current():
+    """Return the set recording keys for this thread, or None."""
+    return getattr(_local, 'recorder', None)
+
+
+def record(keys):
+    recorder = current()
+    if recorder is not None:
+        with _lock:
+            recorder.update(keys)
+
+
+@contextmanager
+def recording():
+    """Within this block, record keys read in a new set, which is yielded."""
+    with at(set()) as recorder:
+        yield recorder
+
+
+@contextmanager
+def at(recorder):
+    """Within this block, record keys read in a set such as one returned by current() in another thread. None records
+    nothing."""
+    previous = current()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
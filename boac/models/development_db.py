@@ -4,6 +4,7 @@ from boac.models.authorized_user import AuthorizedUser
 from boac.models.cohort_filter import CohortFilter
 # Needed for db.create_all to find the model.
 from boac.models.json_cache import JsonCache # noqa
+from boac.models.section_crosswalk import SectionCrosswalk # noqa
 from boac.models.team_member import TeamMember # noqa
 
 
@@ -1,10 +1,21 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 import inspect
+import re
+import threading
+import zlib
 
 from boac import db
+from boac.lib import concurrency, stowed_keys
+from boac.lib.cache import LRUCache
 from boac.models.base import Base
 from decorator import decorator
-from flask import current_app as app
-from sqlalchemy.dialects.postgresql import JSONB
+from flask import current_app as app, has_request_context
+import simplejson as json
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert, JSONB
 
 
 class JsonCache(Base):
@@ -13,33 +24,134 @@ class JsonCache(Base):
     id = db.Column(db.Integer, nullable=False, primary_key=True)
     key = db.Column(db.String, nullable=False, unique=True)
     json = db.Column(JSONB)
+    # Large payloads may instead be stored here in an encoded form; see encode_json.
+    data = db.Column(db.LargeBinary)
+    expires_at = db.Column(db.DateTime)
 
-    def __init__(self, key, json=None):
+    def __init__(self, key, json=None, expires_at=None):
         self.key = key
-        self.json = json
+        self.set_json(json)
+        self.expires_at = expires_at
+
+    def get_json(self):
+        return self.json if self.data is None else decode_json(self.data)
+
+    def set_json(self, value):
+        self.json, self.data = encode_json(value)
 
     def __repr__(self):
-        return '<JsonCache {}, json={}, updated={}, created={}>'.format(
+        return '<JsonCache {}, json={}, data={} bytes, expires={}, updated={}, created={}>'.format(
             self.key,
             self.json,
+            len(self.data) if self.data is not None else None,
+            self.expires_at,
             self.updated_at,
             self.created_at,
         )
 
 
+"""Format version byte prefixed to encoded payloads in the data column."""
+FORMAT_ZLIB_JSON = 1
+
+
+def encode_json(value):
+    """Return a (json, data) pair of column values for a JSON-compatible value. If the serialized JSON is at least
+    JSON_CACHE_COMPRESSION_THRESHOLD bytes, it is zlib-compressed into data; otherwise it is stored as plain JSONB."""
+    threshold = app.config['JSON_CACHE_COMPRESSION_THRESHOLD']
+    if threshold and value is not None:
+        serialized = json.dumps(value, ignore_nan=True).encode('utf-8')
+        if len(serialized) >= threshold:
+            compressed = zlib.compress(serialized, app.config['JSON_CACHE_COMPRESSION_LEVEL'])
+            return None, bytes([FORMAT_ZLIB_JSON]) + compressed
+    return value, None
+
+
+def decode_json(data):
+    data = bytes(data)
+    if data[0] == FORMAT_ZLIB_JSON:
+        return json.loads(zlib.decompress(data[1:]).decode('utf-8'))
+    raise ValueError('Unknown json_cache data format {}'.format(data[0]))
+
+
+"""Hot entries are also held in a per-process LRU cache, so that repeated reads within a worker skip the DB. Stowed
+JSON is shared by reference between readers and must not be modified. The LRU is best-effort: clearing, expiring or
+restowing entries empties only this process's LRU, and other processes hold on to their copies for up to
+JSON_CACHE_LRU_TTL seconds."""
+_lru = None
+_lru_lock = threading.Lock()
+_missing = object()
+
+"""While serving requests, entries nearing expiry (and, in stale-while-revalidate mode, expired entries) are refreshed
+on a background thread pool, at most once at a time per key."""
+_refresh_executor = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+"""Concurrent fetches of the same missing or expired key within this process share a single upstream call."""
+_single_flight = concurrency.SingleFlight()
+
+"""The key on whose advisory lock this thread is fetching, if any."""
+_advisory_lock = threading.local()
+
+"""How stale was the expired JSON served in stale-while-revalidate mode."""
+_staleness = {
+    'served_stale': 0,
+    'total_staleness': 0.0,
+    'max_staleness': 0.0,
+}
+
+
 def clear(key_like):
+    """Delete entries matching a pattern. Other processes may go on serving them from their LRU caches for up to
+    JSON_CACHE_LRU_TTL seconds."""
     matches = db.session.query(JsonCache).filter(JsonCache.key.like(key_like))
     app.logger.info('Will delete {count} entries matching {key_like}'.format(count=matches.count(), key_like=key_like))
     matches.delete(synchronize_session=False)
+    key_regex = _like_to_regex(key_like)
+    _clear_lru(lambda key: key_regex.match(key))
 
 
 def clear_other(key_like):
     matches = db.session.query(JsonCache).filter(JsonCache.key.notlike(key_like))
     app.logger.info('Will delete {count} entries not matching {key_like}'.format(count=matches.count(), key_like=key_like))
     matches.delete(synchronize_session=False)
+    key_regex = _like_to_regex(key_like)
+    _clear_lru(lambda key: not key_regex.match(key))
+
+
+def expire(key_like):
+    """Mark entries matching a pattern as expired without deleting them. Their JSON will be refetched on next read,
+    but may still be served in the meantime."""
+    key_regex = _like_to_regex(key_like)
+    _expire(JsonCache.key.like(key_like), lambda key: key_regex.match(key))
+    app.logger.info('Expired entries matching {key_like}'.format(key_like=key_like))
+
+
+def expire_other(key_like):
+    key_regex = _like_to_regex(key_like)
+    _expire(JsonCache.key.notlike(key_like), lambda key: not key_regex.match(key))
+    app.logger.info('Expired entries not matching {key_like}'.format(key_like=key_like))
+
+
+def expire_current_term():
+    """Counterpart to clear_current_term which keeps expired JSON available to stale-while-revalidate reads."""
+    expire_other('term_%')
+    expire('term_{}%'.format(app.config['CANVAS_CURRENT_ENROLLMENT_TERM']))
+    db.session.commit()
+
+
+def _expire(key_criterion, key_predicate):
+    now = datetime.now()
+    matches = db.session.query(JsonCache).filter(key_criterion).filter(
+        db.or_(JsonCache.expires_at.is_(None), JsonCache.expires_at > now),
+    )
+    matches.update({JsonCache.expires_at: now}, synchronize_session=False)
+    _clear_lru(key_predicate)
 
 
 def clear_current_term():
+    """Delete entries which are not term-stamped or are for the current term. As with clear, other processes may go on
+    serving them from their LRU caches for up to JSON_CACHE_LRU_TTL seconds."""
     # Start by deleting cache which is not term-stamped, on the assumption that those feeds may have changed.
     clear_other('term_%')
     db.session.commit()
@@ -47,36 +159,400 @@ def clear_current_term():
     db.session.commit()
 
 
-def stow(key_pattern, for_term=False):
+def stow(key_pattern, for_term=False, ttl=None):
     """Uses the Decorator module to preserve the wrapped function's signature,
     allowing easy wrapping by other decorators.
     TODO Mockingbird does not currently preserve signatures, and so JsonCache
     cannot directly wrap a @fixture.
+    The decorated function is given a stow_key attribute, returning the key for a given set of arguments, so that
+    stowed results for many calls can be loaded at once by stow_many.
+    If a ttl (timedelta) is given, stowed JSON expires after that interval. Expired JSON is refetched on the next
+    read, but is still returned if the refetch fails. During the last JSON_CACHE_REFRESH_AHEAD fraction of its
+    lifetime, an entry is returned as is and refreshed in the background.
+    If JSON_CACHE_STALE_WHILE_REVALIDATE is set, requests are not kept waiting on refetches of expired JSON either:
+    the expired JSON is returned immediately and refreshed in the background.
     """
     @decorator
     def _stow(func, *args, **kw):
-        key = _format_from_args(func, key_pattern, *args, **kw)
-        if for_term:
-            term_name = app.config['CANVAS_CURRENT_ENROLLMENT_TERM']
-            key = 'term_{}-{}'.format(
-                term_name,
-                key,
-            )
-        stowed = JsonCache.query.filter_by(key=key).first()
-        if stowed:
+        key = _stow_key(func, key_pattern, for_term, *args, **kw)
+        return _load_or_fetch(func, ttl, [(key, args, kw)])[0]
+
+    def _stow_decorator(func):
+        stowed_func = _stow(func)
+        stowed_func.stow_key = partial(_stow_key, func, key_pattern, for_term)
+        stowed_func.stow_ttl = ttl
+        return stowed_func
+    return _stow_decorator
+
+
+def stow_many(stowed_func, args_list, max_workers=1):
+    """Batch equivalent of calling a @stow-decorated function once for each tuple of arguments in args_list. All
+    stowed results are loaded in a single query, and the wrapped function is called only for missing or expired keys,
+    on up to max_workers threads. Results are returned in argument order.
+    """
+    calls = [(stowed_func.stow_key(*args), tuple(args), {}) for args in args_list]
+    return _load_or_fetch(stowed_func.__wrapped__, stowed_func.stow_ttl, calls, max_workers)
+
+
+def get_many(keys):
+    """Return a dict of unexpired stowed JSON for those of the given keys that are found in the LRU cache or the DB."""
+    found = _get_many_from_lru(keys)
+    for key, row in _get_rows(set(keys) - set(found)).items():
+        if not _is_expired(row):
+            found[key] = row.get_json()
+    return found
+
+
+def is_due(key, ttl=None):
+    """Whether a key is missing, expired or (given its ttl) due for refresh, checked without loading its JSON."""
+    row = db.session.query(JsonCache.expires_at).filter(JsonCache.key == key).first()
+    if row is None:
+        return True
+    refresh_at = _refresh_at(row.expires_at, ttl) or row.expires_at
+    return refresh_at is not None and refresh_at <= datetime.now()
+
+
+def stow_pages(key, feed, ttl=None, on_page=None):
+    """Stow a JSON array from a paged feed (such as canvas.PagedFeed), whose pages() yields lists of items and whose
+    failed attribute is set if it could not be read in full. Pages are serialized as they arrive and, once the array
+    reaches JSON_CACHE_COMPRESSION_THRESHOLD bytes, compressed as they arrive, so that the whole array is never held in
+    memory as objects; the row is then written once, encoded as encode_json would encode it. This bound holds only with
+    compression on: with no threshold, the array is stored as JSONB and so is parsed whole before writing. If on_page
+    is given, it is called with each page in turn, so that other consumers can share the single pass over the feed.
+    Returns the number of items stowed, or None if the feed failed, in which case any previously stowed row is left as
+    it was.
+    """
+    encoder = _ArrayEncoder()
+    for page in feed.pages():
+        encoder.add(page)
+        if on_page:
+            on_page(page)
+    if feed.failed:
+        app.logger.warning('{key} could not be fetched in full and will not be stowed'.format(key=key))
+        return None
+    json_value, data = encoder.encode()
+    _upsert_encoded(key, json_value, data, datetime.now() + ttl if ttl else None)
+    _delete_from_lru(key)
+    app.logger.debug('Stowed {count} items in pages for key {key}'.format(count=encoder.count, key=key))
+    return encoder.count
+
+
+def stow_value(stowed_func, args, value):
+    """Stow a value computed elsewhere as the result of a @stow-decorated function for the given arguments."""
+    key = stowed_func.stow_key(*args)
+    ttl = stowed_func.stow_ttl
+    _upsert(key, value, datetime.now() + ttl if ttl else None)
+    _delete_from_lru(key)
+
+
+class _ArrayEncoder:
+    """Serialize a JSON array a few items at a time, keeping it as text while it is smaller than
+    JSON_CACHE_COMPRESSION_THRESHOLD and compressing it from then on."""
+
+    def __init__(self):
+        self.threshold = app.config['JSON_CACHE_COMPRESSION_THRESHOLD']
+        self.count = 0
+        self._text = []
+        self._size = 0
+        self._compressor = None
+        self._compressed = []
+
+    def add(self, items):
+        for item in items:
+            self._write(('[' if not self.count else ', ') + json.dumps(item, ignore_nan=True))
+            self.count += 1
+
+    def encode(self):
+        """Return the (json, data) pair of column values for the array."""
+        self._write(']' if self.count else '[]')
+        if self._compressor:
+            self._compressed.append(self._compressor.flush())
+            return None, bytes([FORMAT_ZLIB_JSON]) + b''.join(self._compressed)
+        return json.loads(''.join(self._text)), None
+
+    def _write(self, text):
+        chunk = text.encode('utf-8')
+        if self._compressor:
+            self._compressed.append(self._compressor.compress(chunk))
+            return
+        self._text.append(text)
+        self._size += len(chunk)
+        if self.threshold and self._size >= self.threshold:
+            self._compressor = zlib.compressobj(app.config['JSON_CACHE_COMPRESSION_LEVEL'])
+            self._compressed.append(self._compressor.compress(''.join(self._text).encode('utf-8')))
+            self._text = []
+
+
+def staleness_stats():
+    with _refresh_lock:
+        stats = dict(_staleness)
+    stats['mean_staleness'] = stats['total_staleness'] / stats['served_stale'] if stats['served_stale'] else 0.0
+    return stats
+
+
+def wait_for_refreshes():
+    """Block until all background refreshes scheduled so far have completed."""
+    global _refresh_executor
+    with _refresh_lock:
+        executor = _refresh_executor
+        _refresh_executor = None
+    if executor:
+        executor.shutdown(wait=True)
+
+
+def _load_or_fetch(func, ttl, calls, max_workers=1):
+    """Given (key, args, kw) calls of func, return results in call order from the LRU cache, the DB, or func. Calls
+    of func for missing keys run on up to max_workers threads."""
+    keys = [key for key, args, kw in calls]
+    stowed_keys.record(keys)
+    results = _get_many_from_lru(keys)
+    rows = _get_rows(set(keys) - set(results))
+    misses = OrderedDict()
+    for key, args, kw in calls:
+        if key in results or key in misses:
+            continue
+        row = rows.get(key)
+        if row and not _is_expired(row):
             app.logger.debug('Returning stowed JSON for key {key}'.format(key=key))
-            return stowed.json
-        else:
-            app.logger.info('{key} not found in DB'.format(key=key))
-            to_stow = func(*args, **kw)
-            if to_stow is not None:
-                app.logger.debug('Will stow JSON for key {key}'.format(key=key))
-                row = JsonCache(key=key, json=to_stow)
-                db.session.add(row)
+            results[key] = row.get_json()
+            refresh_at = _refresh_at(row.expires_at, ttl)
+            if refresh_at and refresh_at <= datetime.now():
+                _schedule_refresh(key, func, args, kw, ttl)
             else:
-                app.logger.info('{key} not generated and will not be stowed in DB'.format(key=key))
-            return to_stow
-    return _stow
+                _set_in_lru(key, results[key], refresh_at)
+        elif row and _serve_stale():
+            _record_staleness(key, row)
+            results[key] = row.get_json()
+            _schedule_refresh(key, func, args, kw, ttl)
+        else:
+            misses[key] = (args, kw, row)
+    if max_workers > 1 and len(misses) > 1:
+        # Worker threads have their own DB sessions, and look up rows for themselves.
+        def _fetch_in_worker(key):
+            args, kw, row = misses[key]
+            return _single_flight.do(key, _fetch_and_stow_in_worker, key, func, args, kw, ttl)
+        results.update(zip(misses, concurrency.map_in_app_context(_fetch_in_worker, misses, max_workers)))
+    else:
+        for key, (args, kw, row) in misses.items():
+            results[key] = _single_flight.do(key, _fetch_and_stow_exclusively, key, func, args, kw, ttl, row)
+    return [results[key] for key in keys]
+
+
+def _fetch_and_stow_in_worker(key, func, args, kw, ttl):
+    row = JsonCache.query.filter_by(key=key).first()
+    return _fetch_and_stow_exclusively(key, func, args, kw, ttl, row)
+
+
+def _fetch_and_stow_exclusively(key, func, args, kw, ttl, row=None):
+    """If JSON_CACHE_ADVISORY_LOCKS is set, coalesce fetches across worker processes as well, by holding a Postgres
+    advisory lock on the key while fetching. The lock is held on a connection of its own, and the stowed JSON is
+    committed before it is released. A thread holds at most one such lock: stowed calls nested within a locked fetch
+    (such as the summaries read while fetching course analytics) are coalesced by the outer key's lock and take none
+    of their own, so that a fetch ties up no more than one extra connection and workers nesting keys in different
+    orders cannot deadlock."""
+    if not app.config['JSON_CACHE_ADVISORY_LOCKS'] or getattr(_advisory_lock, 'key', None) is not None:
+        return _fetch_and_stow(key, func, args, kw, ttl, row)
+    lock_connection = db.engine.connect()
+    try:
+        lock_connection.execute(text('SELECT pg_advisory_lock(hashtext(:key))'), key=key)
+        _advisory_lock.key = key
+        try:
+            # Another worker may have stowed the key while we waited for the lock.
+            row = JsonCache.query.filter_by(key=key).populate_existing().first()
+            if row and not _is_expired(row):
+                app.logger.debug('Returning JSON for key {key} stowed by another worker'.format(key=key))
+                stowed = row.get_json()
+                _set_in_lru(key, stowed, _refresh_at(row.expires_at, ttl))
+                return stowed
+            stowed = _fetch_and_stow(key, func, args, kw, ttl, row)
+            db.session.commit()
+            return stowed
+        finally:
+            _advisory_lock.key = None
+            lock_connection.execute(text('SELECT pg_advisory_unlock(hashtext(:key))'), key=key)
+    finally:
+        lock_connection.close()
+
+
+def _fetch_and_stow(key, func, args, kw, ttl, row=None):
+    if row:
+        app.logger.info('{key} expired at {expires_at}'.format(key=key, expires_at=row.expires_at))
+    else:
+        app.logger.info('{key} not found in DB'.format(key=key))
+    to_stow = func(*args, **kw)
+    if to_stow is not None:
+        app.logger.debug('Will stow JSON for key {key}'.format(key=key))
+        expires_at = datetime.now() + ttl if ttl else None
+        if row:
+            row.set_json(to_stow)
+            row.expires_at = expires_at
+        else:
+            _upsert(key, to_stow, expires_at)
+        _set_in_lru(key, to_stow, _refresh_at(expires_at, ttl))
+        return to_stow
+    elif row:
+        app.logger.warning('{key} could not be refreshed; will return expired JSON'.format(key=key))
+        return row.get_json()
+    else:
+        app.logger.info('{key} not generated and will not be stowed in DB'.format(key=key))
+        return to_stow
+
+
+def _upsert(key, value, expires_at):
+    """Insert a new row, or update it if another session has inserted the same key since we looked."""
+    json_value, data = encode_json(value)
+    _upsert_encoded(key, json_value, data, expires_at)
+
+
+def _upsert_encoded(key, json_value, data, expires_at):
+    now = datetime.now()
+    statement = insert(JsonCache.__table__).values(
+        key=key,
+        json=json_value,
+        data=data,
+        expires_at=expires_at,
+        created_at=now,
+        updated_at=now,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['key'],
+        set_={
+            'json': statement.excluded.json,
+            'data': statement.excluded.data,
+            'expires_at': statement.excluded.expires_at,
+            'updated_at': now,
+        },
+    )
+    db.session.execute(statement)
+
+
+def _refresh(key, func, args, kw, ttl):
+    try:
+        row = JsonCache.query.filter_by(key=key).first()
+        _fetch_and_stow(key, func, args, kw, ttl, row)
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(key)
+
+
+def _schedule_refresh(key, func, args, kw, ttl):
+    global _refresh_executor
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        thread_count = app.config['JSON_CACHE_REFRESH_THREADS']
+        if thread_count and not _refresh_executor:
+            _refresh_executor = ThreadPoolExecutor(max_workers=thread_count)
+        executor = _refresh_executor
+    app.logger.debug('Will refresh JSON for key {key}'.format(key=key))
+    # Outside of request handling (e.g., when loading the cache from the command line) there is no one to keep waiting,
+    # and we refresh synchronously.
+    if executor and has_request_context():
+        # The background app context commits the refreshed row on teardown.
+        concurrency.submit_in_app_context(executor, _refresh, key, func, args, kw, ttl)
+    else:
+        _refresh(key, func, args, kw, ttl)
+
+
+def _serve_stale():
+    return app.config['JSON_CACHE_STALE_WHILE_REVALIDATE'] and has_request_context()
+
+
+def _record_staleness(key, row):
+    staleness = (datetime.now() - row.expires_at).total_seconds()
+    app.logger.info('Returning JSON for key {key}, expired {staleness} seconds ago'.format(key=key, staleness=staleness))
+    with _refresh_lock:
+        _staleness['served_stale'] += 1
+        _staleness['total_staleness'] += staleness
+        _staleness['max_staleness'] = max(_staleness['max_staleness'], staleness)
+
+
+def _get_rows(keys):
+    if not keys:
+        return {}
+    return {row.key: row for row in JsonCache.query.filter(JsonCache.key.in_(list(keys))).all()}
+
+
+def _get_many_from_lru(keys):
+    found = {}
+    lru = lru_cache()
+    if lru:
+        for key in keys:
+            cached = lru.get(key, _missing)
+            if cached is not _missing:
+                app.logger.debug('Returning cached JSON for key {key}'.format(key=key))
+                found[key] = cached
+    return found
+
+
+def _set_in_lru(key, value, refresh_at=None):
+    """Cache a value, keeping it no longer than the time at which its row becomes due for refresh."""
+    lru = lru_cache()
+    if lru:
+        ttl = (refresh_at - datetime.now()).total_seconds() if refresh_at else None
+        if ttl is None or ttl > 0:
+            lru.set(key, value, ttl)
+
+
+def _is_expired(row):
+    return row.expires_at is not None and row.expires_at <= datetime.now()
+
+
+def _refresh_at(expires_at, ttl):
+    if expires_at is None or not ttl:
+        return None
+    return expires_at - ttl * app.config['JSON_CACHE_REFRESH_AHEAD']
+
+
+def _stow_key(func, key_pattern, for_term, *args, **kw):
+    key = _format_from_args(func, key_pattern, *args, **kw)
+    if for_term:
+        term_name = app.config['CANVAS_CURRENT_ENROLLMENT_TERM']
+        key = 'term_{}-{}'.format(
+            term_name,
+            key,
+        )
+    return key
+
+
+def lru_cache():
+    """Return this process's LRU cache of stowed JSON, or False if disabled by configuration."""
+    global _lru
+    if _lru is None:
+        with _lru_lock:
+            if _lru is None:
+                max_entries = app.config['JSON_CACHE_LRU_MAX_ENTRIES']
+                _lru = LRUCache(
+                    max_entries=max_entries,
+                    max_bytes=app.config['JSON_CACHE_LRU_MAX_BYTES'],
+                    ttl=app.config['JSON_CACHE_LRU_TTL'],
+                ) if max_entries else False
+    return _lru
+
+
+def lru_stats():
+    lru = lru_cache()
+    return lru.stats() if lru else None
+
+
+def _delete_from_lru(key):
+    lru = lru_cache()
+    if lru:
+        lru.delete(key)
+
+
+def _clear_lru(predicate):
+    lru = lru_cache()
+    if lru:
+        lru.delete_matching(predicate)
+
+
+def _like_to_regex(key_like):
+    """Translate a SQL LIKE pattern to an equivalent compiled regular expression."""
+    wildcards = {'%': '.*', '_': '.'}
+    pattern = ''.join(wildcards.get(c) or re.escape(c) for c in key_like)
+    return re.compile(pattern + r'\Z', re.DOTALL)
 
 
 def _format_from_args(func, pattern, *args, **kw):
@@ -0,0 +1,64 @@
+"""Crosswalk from Canvas course sections to SIS terms and CCNs"""
+
+from boac import db
+from boac.lib import berkeley
+from boac.models.base import Base
+
+
+class SectionCrosswalk(Base):
+    __tablename__ = 'section_crosswalk'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    canvas_course_id = db.Column(db.Integer, nullable=False)
+    canvas_section_id = db.Column(db.Integer, nullable=False)
+    # Manually created sections have no SIS term or CCN, but are recorded so that their course counts as loaded.
+    sis_term_id = db.Column(db.String(4))
+    ccn = db.Column(db.String(5))
+    __table_args__ = (
+        db.UniqueConstraint('canvas_course_id', 'canvas_section_id', name='section_crosswalk_canvas_ids'),
+    )
+
+    def __init__(self, canvas_course_id, canvas_section_id, sis_term_id=None, ccn=None):
+        self.canvas_course_id = canvas_course_id
+        self.canvas_section_id = canvas_section_id
+        self.sis_term_id = sis_term_id
+        self.ccn = ccn
+
+    def __repr__(self):
+        return '<SectionCrosswalk canvas_course_id={}, canvas_section_id={}, sis_term_id={}, ccn={}, updated={}, created={}>'.format(
+            self.canvas_course_id,
+            self.canvas_section_id,
+            self.sis_term_id,
+            self.ccn,
+            self.updated_at,
+            self.created_at,
+        )
+
+    @classmethod
+    def refresh_course(cls, canvas_course_id, sections):
+        """Replace the crosswalk rows for a Canvas course with rows for the given Canvas sections feed. The caller
+        commits. Should a section recur in the feed, the first instance wins."""
+        cls.query.filter_by(canvas_course_id=canvas_course_id).delete(synchronize_session=False)
+        section_ids = set()
+        for section in sections:
+            if section['id'] in section_ids:
+                continue
+            section_ids.add(section['id'])
+            sis_term_id, ccn = berkeley.parse_sis_section_id(section.get('sis_section_id')) or (None, None)
+            db.session.add(cls(canvas_course_id, section['id'], sis_term_id, ccn))
+
+    @classmethod
+    def ccns_for_courses(cls, canvas_course_ids, sis_term_id=None):
+        """Return a dict of official section CCNs, in section order, by Canvas course ID, optionally limited to sections
+        in one SIS term. Courses not in the crosswalk are left out of the dict."""
+        ccns_by_course_id = {}
+        if not canvas_course_ids:
+            return ccns_by_course_id
+        if sis_term_id is not None:
+            sis_term_id = str(sis_term_id)
+        rows = cls.query.filter(cls.canvas_course_id.in_(canvas_course_ids)).order_by(cls.id).all()
+        for row in rows:
+            ccns = ccns_by_course_id.setdefault(row.canvas_course_id, [])
+            if row.ccn and (sis_term_id is None or row.sis_term_id == sis_term_id):
+                ccns.append(row.ccn)
+        return ccns_by_course_id
@@ -1,8 +1,13 @@
 """Team membership"""
 
+import base64
+import binascii
+
 from boac import db
 from boac.models.base import Base
-from sqlalchemy import func, UniqueConstraint
+import simplejson as json
+from sqlalchemy import distinct, func, tuple_, UniqueConstraint
+from sqlalchemy.orm import aliased
 
 
 class TeamMember(Base):
@@ -114,25 +119,41 @@ class TeamMember(Base):
         }
 
     @classmethod
-    def summarize_team_members(cls, team_codes, order_by='member_name', offset=0, limit=50):
+    def summarize_team_members(cls, team_codes, order_by='member_name', offset=0, limit=50, cursor=None):
+        """Return a page of the distinct students on any of the given teams, ordered by name or UID. A page may be
+        requested by offset, or by the nextCursor returned with the page before it, which skips straight to the page
+        however deep it is. The cursor also carries the total member count, so that it is counted only once per filter
+        rather than on every page. Raises ValueError for a cursor not issued for these teams and ordering."""
         summary = {
-            'teams': [],
+            'teams': [{'code': code, 'name': cls.team_definitions.get(code, code)} for code in team_codes],
         }
-        for code in team_codes:
-            team = TeamMember.for_code(code)
-            summary['teams'].append({
-                'code': code,
-                'name': team['name'],
-            })
-        o = TeamMember.member_uid if order_by == 'member_uid' else TeamMember.member_name
-        f = TeamMember.code.in_(team_codes)
-        results = TeamMember.query.distinct(o).order_by(o).filter(f).offset(offset).limit(limit).all()
-
-        summary['members'] = []
-        for row in results:
-            summary['members'].append(TeamMember.translate_row(row))
-
-        summary['totalMemberCount'] = TeamMember.query.distinct(o).filter(f).count()
+        sort_column = cls.member_uid if order_by == 'member_uid' else cls.member_name
+        sort_key = func.coalesce(sort_column, '')
+        # A student on several of the teams is listed once, by their first team membership. Ruling out later memberships
+        # row by row, rather than first collecting every student on the teams, lets a page be read off the sort key index
+        # from the cursor onward.
+        earlier = aliased(cls)
+        earlier_membership = db.session.query(earlier.id).filter(
+            earlier.member_csid == cls.member_csid,
+            earlier.code.in_(team_codes),
+            earlier.id < cls.id,
+        ).exists()
+        query = cls.query.filter(cls.code.in_(team_codes), ~earlier_membership).order_by(sort_key, cls.id)
+        if cursor:
+            after_sort_key, after_id, total_member_count = _decode_cursor(cursor, team_codes, order_by)
+            query = query.filter(tuple_(sort_key, cls.id) > tuple_(after_sort_key, after_id))
+        else:
+            total_member_count = db.session.query(func.count(distinct(cls.member_csid))).filter(cls.code.in_(team_codes)).scalar()
+            query = query.offset(offset)
+        # Fetch one extra row to learn whether another page follows.
+        results = query.limit(limit + 1).all()
+        summary['members'] = [TeamMember.translate_row(row) for row in results[:limit]]
+        summary['totalMemberCount'] = total_member_count
+        if len(results) > limit:
+            last = results[limit - 1]
+            summary['nextCursor'] = _encode_cursor(team_codes, order_by, getattr(last, sort_column.key) or '', last.id, total_member_count)
+        else:
+            summary['nextCursor'] = None
         db.session.commit()
         return summary
 
@@ -141,3 +162,36 @@ class TeamMember(Base):
             'name': self.member_name,
             'uid': self.member_uid,
         }
+
+
+# Keyset pagination walks these in sort order, checking each membership against earlier ones for the same student.
+db.Index('team_members_member_name_id_index', func.coalesce(TeamMember.member_name, ''), TeamMember.id)
+db.Index('team_members_member_uid_id_index', func.coalesce(TeamMember.member_uid, ''), TeamMember.id)
+db.Index('team_members_member_csid_id_index', TeamMember.member_csid, TeamMember.id)
+
+
+def _encode_cursor(team_codes, order_by, sort_key, member_id, total_member_count):
+    cursor = json.dumps([sorted(team_codes), order_by, sort_key, member_id, total_member_count])
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor, team_codes, order_by):
+    try:
+        cursor_team_codes, cursor_order_by, sort_key, member_id, total_member_count = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')),
+        )
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+    if not isinstance(cursor_team_codes, list) or not all(isinstance(code, str) for code in cursor_team_codes):
+        raise ValueError('Invalid cursor')
+    if not isinstance(cursor_order_by, str) or not isinstance(sort_key, str):
+        raise ValueError('Invalid cursor')
+    if not _is_int(member_id) or not _is_int(total_member_count):
+        raise ValueError('Invalid cursor')
+    if cursor_team_codes != sorted(team_codes) or cursor_order_by != order_by:
+        raise ValueError('Cursor does not match teams {} in order {}'.format(', '.join(team_codes), order_by))
+    return sort_key, member_id, total_member_count
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
@@ -1,3 +1,4 @@
+from boac.lib import deadline
 from boac.models.authorized_user import AuthorizedUser
 from flask import make_response, request
 import flask_login
@@ -34,6 +35,15 @@ def register_routes(app):
     def front_end_route(**kwargs):
         return make_response(open('boac/templates/index.html').read())
 
+    @app.before_request
+    def start_request_deadline():
+        if request.path.startswith('/api'):
+            deadline.start(app.config['REQUEST_DEADLINE'])
+
+    @app.teardown_request
+    def clear_request_deadline(exception=None):
+        deadline.clear()
+
     @app.after_request
     def log_api_requests(response):
         if request.full_path.startswith('/api'):
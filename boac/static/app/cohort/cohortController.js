@@ -33,6 +33,23 @@
       itemsPerPage: 50
     };
 
+    // The cursor returned with a page of results lets the page after it be fetched without an offset.
+    var nextPageCursor = null;
+
+    var getCursor = function(filter, page) {
+      var isNextPage = nextPageCursor && nextPageCursor.filter === filter && nextPageCursor.orderBy === $scope.orderBy.selected && nextPageCursor.page === page;
+      return isNextPage ? nextPageCursor.cursor : null;
+    };
+
+    var setCursor = function(filter, cohort) {
+      nextPageCursor = cohort.nextCursor ? {
+        cursor: cohort.nextCursor,
+        filter: filter,
+        orderBy: $scope.orderBy.selected,
+        page: Math.max($scope.pagination.currentPage, 1) + 1
+      } : null;
+    };
+
     var goToUserPage = function(uid) {
       $state.go('user', {uid: uid});
     };
@@ -57,8 +74,10 @@
     var refreshCohortView = function(callback) {
       var page = $scope.pagination.currentPage;
       var offset = page === 0 ? 0 : (page - 1) * $scope.pagination.itemsPerPage;
-      cohortFactory.getCohort($stateParams.code, $scope.orderBy.selected, offset, $scope.pagination.itemsPerPage).then(
+      var filter = 'cohort/' + $stateParams.code;
+      cohortFactory.getCohort($stateParams.code, $scope.orderBy.selected, offset, $scope.pagination.itemsPerPage, getCursor(filter, page)).then(
         function(response) {
+          setCursor(filter, response.data);
           $scope.cohort = parseCohortFeed(response);
           return callback($scope.cohort);
         },
@@ -86,7 +105,12 @@
         var teamCodes = _.map($scope.search.selected.teams, 'code');
         var page = $scope.pagination.currentPage;
         var offset = page === 0 ? 0 : (page - 1) * $scope.pagination.itemsPerPage;
-        cohortFactory.getTeamsMembers(teamCodes, $scope.orderBy.selected, offset, $scope.pagination.itemsPerPage).then(parseCohortFeed,
+        var filter = 'teams/' + teamCodes.join();
+        cohortFactory.getTeamsMembers(teamCodes, $scope.orderBy.selected, offset, $scope.pagination.itemsPerPage, getCursor(filter, page)).then(
+          function(response) {
+            setCursor(filter, response.data);
+            return parseCohortFeed(response);
+          },
           function(err) {
             $scope.error = err ? {message: err.status + ': ' + err.statusText} : true;
             return callback(null);
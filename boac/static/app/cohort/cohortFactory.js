@@ -26,11 +26,12 @@
       return $http.get('/api/cohorts/all');
     };
 
-    var getCohort = function(code, orderBy, offset, limit) {
+    var getCohort = function(code, orderBy, offset, limit, cursor) {
       return $http.post('/api/cohort/' + code, {
         offset: offset || 0,
         limit: limit || 50,
-        orderBy: orderBy || 'member_name'
+        orderBy: orderBy || 'member_name',
+        cursor: cursor
       });
     };
 
@@ -38,12 +39,13 @@
       return $http.get('/api/cohorts/my');
     };
 
-    var getTeamsMembers = function(teamCodes, orderBy, offset, limit) {
+    var getTeamsMembers = function(teamCodes, orderBy, offset, limit, cursor) {
       return $http.post('/api/teams/members', {
         teamCodes: teamCodes,
         offset: offset || 0,
         limit: limit || 50,
-        orderBy: orderBy || 'member_name'
+        orderBy: orderBy || 'member_name',
+        cursor: cursor
       });
     };
 
@@ -44,6 +44,8 @@ CANVAS_HTTP_URL = 'https://wottsamatta.instructure.com'
 CANVAS_HTTP_TOKEN = 'yet another secret'
 
 CANVAS_CURRENT_ENROLLMENT_TERM = 'Fall 2017'
+# Pages of a paged Canvas feed to fetch concurrently, once the first page links to the last.
+CANVAS_PAGE_THREADS = 4
 
 # SIS APIs
 ATHLETE_API_ID = 'secretid'
@@ -58,6 +60,102 @@ STUDENT_API_ID = 'secretid'
 STUDENT_API_KEY = 'secretkey'
 STUDENT_API_URL = 'https://secreturl.berkeley.edu/students'
 
+# Outbound HTTP connection pooling. Each upstream host gets one keep-alive session holding up to
+# HTTP_POOL_MAXSIZE connections; if HTTP_POOL_BLOCK is set, threads wait for a free connection rather
+# than opening a throwaway one.
+HTTP_POOL_MAXSIZE = 10
+HTTP_POOL_BLOCK = False
+
+# Maximum simultaneous requests per upstream API from one worker process. Upstreams not listed are unlimited.
+HTTP_UPSTREAM_CONCURRENCY = {
+    'canvas': 4,
+    'sis_athlete_api': 2,
+    'sis_enrollments_api': 2,
+    'sis_student_api': 2,
+}
+
+# Requests per second, and the burst of requests allowed above that rate, per upstream API from one worker process.
+# Canvas reports its remaining request quota in X-Rate-Limit-Remaining; as that falls below low_water we slow down in
+# proportion. Upstreams not listed are not rate limited.
+HTTP_UPSTREAM_RATE_LIMITS = {
+    'canvas': {'rate': 20, 'burst': 40, 'low_water': 300},
+    'sis_athlete_api': {'rate': 5, 'burst': 10},
+    'sis_enrollments_api': {'rate': 5, 'burst': 10},
+    'sis_student_api': {'rate': 5, 'burst': 10},
+}
+
+# Failed outbound requests are retried up to HTTP_RETRIES times if the failure may be transient: connection errors,
+# timeouts, 5xx responses and rate limiting. Retries back off exponentially from HTTP_RETRY_BACKOFF seconds, with
+# jitter, or wait as long as a Retry-After header asks. No single wait exceeds HTTP_RETRY_MAX_DELAY seconds; a longer
+# Retry-After fails the request instead.
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_RETRY_MAX_DELAY = 30
+
+# (connect, read) timeouts in seconds for outbound requests per upstream API, with 'default' covering the rest.
+HTTP_TIMEOUTS = {
+    'default': (3.05, 30),
+    'canvas': (3.05, 30),
+    'sis_athlete_api': (3.05, 15),
+    'sis_enrollments_api': (3.05, 15),
+    'sis_student_api': (3.05, 15),
+}
+
+# Time budget in seconds for handling an API request. Outbound requests are neither sent nor retried once it is spent,
+# so that a slow upstream returns partial results rather than tying up a worker thread. Set to None for no limit.
+REQUEST_DEADLINE = 30
+
+# Number of students whose external data is loaded in parallel by 'flask load_external_data'. Set to 1
+# to load serially.
+CACHE_WARMUP_THREADS = 4
+
+# Per-process LRU cache in front of the json_cache table. Limits apply to entry count and approximate size in bytes
+# of cached JSON; entries are re-read from the DB after JSON_CACHE_LRU_TTL seconds. Clearing or expiring the json_cache
+# empties only the LRU of the process doing so, so other workers may serve their copies for up to JSON_CACHE_LRU_TTL
+# seconds longer; keep it short. Set entries to 0 to disable.
+JSON_CACHE_LRU_MAX_ENTRIES = 2000
+JSON_CACHE_LRU_MAX_BYTES = 100 * 1024 * 1024
+JSON_CACHE_LRU_TTL = 300
+
+# Stowed JSON with a TTL is refreshed in the background once it enters the final JSON_CACHE_REFRESH_AHEAD fraction of
+# its lifetime. Set threads to 0 to refresh synchronously on read.
+JSON_CACHE_REFRESH_AHEAD = 0.25
+JSON_CACHE_REFRESH_THREADS = 2
+
+# When serving requests, return expired JSON immediately and refresh it in the background.
+JSON_CACHE_STALE_WHILE_REVALIDATE = True
+
+# Coalesce fetches of the same missing key across worker processes with Postgres advisory locks. (Fetches within a
+# process are always coalesced.) Each key so fetched is committed as soon as it is stowed, along with anything else
+# pending in the session. Each lock is held on a DB connection of its own, so a thread fetching a key ties up two pool
+# connections (keys fetched within that fetch take no lock of their own); allow for them in the pool size.
+JSON_CACHE_ADVISORY_LOCKS = False
+
+# Stowed JSON serializing to at least this many bytes is stored zlib-compressed rather than as JSONB. Set to None to
+# store everything as JSONB, in which case feeds stowed page by page are held whole in memory before they are written.
+JSON_CACHE_COMPRESSION_THRESHOLD = 64 * 1024
+JSON_CACHE_COMPRESSION_LEVEL = 6
+
+# Worker threads fetching feeds missing from the cache for the members of a team.
+MEMBER_PROFILE_THREADS = 8
+
+# Per-process cache of rendered team and saved-cohort pages. A cached page is rendered afresh as soon as the team
+# memberships, saved cohort or stowed JSON it was rendered from change, and is in any case dropped after
+# RESULT_CACHE_TTL seconds. Set entries to 0 to disable.
+RESULT_CACHE_MAX_ENTRIES = 500
+RESULT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+RESULT_CACHE_TTL = 3600
+
+# Worker threads and deadline (in seconds) for the concurrent fetches behind a single student's analytics. Data not
+# fetched in time is left out of the response.
+USER_ANALYTICS_THREADS = 4
+USER_ANALYTICS_TIMEOUT = 20
+
+# App startup must finish within this many seconds, without importing any of these modules; heavy dependencies
+# should be imported where used. Enforced by tests rather than at runtime.
+STARTUP_TIME_BUDGET = 5
+STARTUP_IMPORT_DENYLIST = ['numpy', 'pandas']
+
 # Logging
 LOGGING_FORMAT = '[%(asctime)s] - %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
 LOGGING_LOCATION = 'boac.log'
@@ -65,3 +163,11 @@ LOGGING_LEVEL = logging.DEBUG
 
 # Caching (number of seconds, or false to disable)
 CACHE_DEFAULT = False
+
+# App cache backend: 'lru' for a cache in each worker process, holding up to CACHE_MAX_ENTRIES; 'filesystem' for one
+# shared by the worker processes on a host, holding up to CACHE_MAX_ENTRIES files in CACHE_DIR; or 'redis' for one
+# shared through the Redis server at CACHE_REDIS_URL, which applies its own eviction policy.
+CACHE_BACKEND = 'lru'
+CACHE_MAX_ENTRIES = 10000
+CACHE_DIR = '/tmp/boac-cache'
+CACHE_REDIS_URL = 'redis://localhost:6379/0'
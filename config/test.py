@@ -5,3 +5,13 @@ CANVAS_HTTP_URL = 'https://bcourses.berkeley.edu'
 CANVAS_HTTP_TOKEN = 'secret'
 
 LOGGING_LOCATION = 'STDOUT'
+
+HTTP_RETRY_BACKOFF = 0
+HTTP_UPSTREAM_RATE_LIMITS = {}
+
+# Tests roll back DB transactions, which neither an in-process cache nor background threads would see.
+JSON_CACHE_LRU_MAX_ENTRIES = 0
+RESULT_CACHE_MAX_ENTRIES = 0
+JSON_CACHE_REFRESH_THREADS = 0
+USER_ANALYTICS_THREADS = 1
+MEMBER_PROFILE_THREADS = 1
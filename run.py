@@ -16,6 +16,7 @@ import os
 import subprocess
 
 from boac.factory import create_app
+import click
 
 # When running under WSGI, system environment variables are not automatically made available to Python code, and
 # an app restart will result in configurations being lost. We work around this with an explicit load from the shell
@@ -43,9 +44,10 @@ def load_external_data():
 
 
 @application.cli.command()
-def refresh_external_data():
+@click.option('--force', is_flag=True, help='Refetch all current feeds, not only those expired or nearing expiry.')
+def refresh_external_data(force):
     from boac.api import cache_utils
-    cache_utils.refresh_current_term()
+    cache_utils.refresh_current_term(force=force)
 
 
 host = application.config['HOST']
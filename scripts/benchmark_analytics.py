@@ -0,0 +1,79 @@
+"""Compare the NumPy course analytics in boac.lib.analytics with the pandas implementation it replaced, using the
+paged Canvas student summaries fixture for a large course. Requires pandas, which BOAC itself no longer does."""
+
+import glob
+import json
+import math
+import timeit
+
+from scriptpath import scriptify
+
+
+RUNS = 20
+
+
+def pandas_analytics_from_summary_feed(summary_feed, canvas_user_id):
+    """The former per-request implementation, kept here as a reference."""
+    import pandas
+
+    df = pandas.DataFrame(summary_feed, columns=['id', 'page_views', 'participations', 'tardiness_breakdown'])
+    df.fillna(0, inplace=True)
+    df['on_time'] = df['tardiness_breakdown'].map(lambda t: t['on_time'])
+    student_row = df.loc[df['id'].values == canvas_user_id]
+
+    def analytics_for_column(column_name):
+        column = df[column_name]
+        column_zscore = (student_row[column_name].values[0] - column.mean()) / column.std(ddof=0)
+        return {
+            'courseDeciles': [column.quantile(n / 10) for n in range(0, 11)],
+            'student': {
+                'raw': student_row[column_name].values[0].item(),
+                'zscore': column_zscore,
+                'percentile': 50 * (math.erf(column_zscore / 2 ** .5) + 1),
+            },
+        }
+
+    return {
+        'assignmentsOnTime': analytics_for_column('on_time'),
+        'pageViews': analytics_for_column('page_views'),
+        'participations': analytics_for_column('participations'),
+    }
+
+
+@scriptify.in_app
+def main(app):
+    from boac.lib import analytics
+
+    summaries = []
+    fixture_pattern = app.config['BASE_DIR'] + '/fixtures/canvas_student_summaries_for_course_7654321_page_*.json'
+    for path in sorted(glob.glob(fixture_pattern)):
+        with open(path) as file:
+            summaries.extend(json.load(file))
+    canvas_user_ids = [summary['id'] for summary in summaries]
+    course = {'id': 7654321}
+    print('{} students in course'.format(len(summaries)))
+
+    mismatches = 0
+    course_analytics = analytics.analytics_for_course(summaries)
+    for canvas_user_id in canvas_user_ids:
+        expected = pandas_analytics_from_summary_feed(summaries, canvas_user_id)
+        actual = analytics.student_analytics(course_analytics, canvas_user_id, course)
+        if expected != actual:
+            mismatches += 1
+    print('{} students with analytics differing from pandas'.format(mismatches))
+
+    timings = {
+        'pandas, one student': lambda: pandas_analytics_from_summary_feed(summaries, canvas_user_ids[0]),
+        'numpy, one student': lambda: analytics.analytics_from_summary_feed(summaries, canvas_user_ids[0], course),
+        'numpy, whole course': lambda: analytics.analytics_for_course(summaries),
+        'lookup, one student': lambda: analytics.student_analytics(course_analytics, canvas_user_ids[0], course),
+    }
+    for label, func in timings.items():
+        elapsed = timeit.timeit(func, number=RUNS) / RUNS
+        print('{:<20} {:10.3f} ms'.format(label, elapsed * 1000))
+    print('pandas, whole course ~{:.0f} ms'.format(
+        timeit.timeit(timings['pandas, one student'], number=RUNS) / RUNS * len(canvas_user_ids) * 1000,
+    ))
+
+
+main()
@@ -0,0 +1,56 @@
+"""Compare read latency and storage size of plain JSONB and compressed json_cache rows, using the paged Canvas
+student summaries fixture for a large course."""
+
+import glob
+import json
+import timeit
+
+from scriptpath import scriptify
+
+
+READS = 50
+
+
+@scriptify.in_app
+def main(app):
+    from boac import db
+    from boac.models import json_cache
+    from boac.models.json_cache import JsonCache
+
+    summaries = []
+    fixture_pattern = app.config['BASE_DIR'] + '/fixtures/canvas_student_summaries_for_course_7654321_page_*.json'
+    for path in sorted(glob.glob(fixture_pattern)):
+        with open(path) as file:
+            summaries.extend(json.load(file))
+
+    plain_key = 'benchmark_plain_jsonb'
+    compressed_key = 'benchmark_compressed'
+    plain_row = JsonCache(key=plain_key)
+    plain_row.json = summaries
+    compressed_row = JsonCache(key=compressed_key)
+    compressed_row.json = None
+    compressed_row.data = json_cache.encode_json(summaries)[1] if app.config['JSON_CACHE_COMPRESSION_THRESHOLD'] else None
+    if compressed_row.data is None:
+        print('Compression is disabled by configuration.')
+        return
+    db.session.add_all([plain_row, compressed_row])
+    db.session.commit()
+
+    try:
+        for key in [plain_key, compressed_key]:
+            def read():
+                db.session.expire_all()
+                return JsonCache.query.filter_by(key=key).first().get_json()
+            assert read() == summaries
+            seconds = timeit.timeit(read, number=READS)
+            size = db.session.execute(
+                'SELECT coalesce(pg_column_size(json), 0) + coalesce(pg_column_size(data), 0) FROM json_cache WHERE key = :key',
+                {'key': key},
+            ).scalar()
+            print('{}: {:.2f} ms per read, {} bytes stored'.format(key, 1000 * seconds / READS, size))
+    finally:
+        JsonCache.query.filter(JsonCache.key.in_([plain_key, compressed_key])).delete(synchronize_session=False)
+        db.session.commit()
+
+
+main()
@@ -0,0 +1,80 @@
+"""Compare CCN-indexed matching of Canvas sections to SIS enrollments in boac.lib.merged with the linear scan it
+replaced, for a synthetic student with a large schedule."""
+
+import re
+import timeit
+
+from scriptpath import scriptify
+
+
+SITES = 40
+SECTIONS_PER_SITE = 30
+ENROLLMENTS = 400
+RUNS = 50
+
+
+def linear_merge(canvas_course_sites, sections_by_site_id, enrollments):
+    """The former implementation, kept here as a reference."""
+    from boac.api import util as api_util
+
+    for site in canvas_course_sites:
+        site['sisEnrollments'] = []
+        for section in sections_by_site_id[site['canvasCourseId']]:
+            canvas_sis_section_id = section.get('sis_section_id') or ''
+            ccn_match = re.match(r'\ASEC:20\d{2}-[BCD]-(\d{5})', canvas_sis_section_id)
+            if not ccn_match:
+                continue
+            canvas_ccn = ccn_match.group(1)
+            for enrollment in enrollments:
+                if canvas_ccn == str(enrollment.get('classSection', {}).get('id')):
+                    site['sisEnrollments'].append(api_util.sis_enrollment_api_feed(enrollment))
+                    break
+
+
+def indexed_merge(canvas_course_sites, sections_by_site_id, enrollments, ccns_by_site_id=None):
+    from boac.lib import merged
+
+    if ccns_by_site_id is None:
+        ccns_by_site_id = {site_id: merged.section_ccns(sections) for site_id, sections in sections_by_site_id.items()}
+    merged.merge_enrollments_by_ccn(canvas_course_sites, ccns_by_site_id, merged.enrollment_ccn_index(enrollments))
+
+
+@scriptify.in_app
+def main(app):
+    from boac.lib import merged
+
+    sections_by_site_id = {}
+    for site_index in range(SITES):
+        sections = [{'sis_section_id': 'SEC:2017-D-{}'.format(10000 + site_index * SECTIONS_PER_SITE + n)} for n in range(SECTIONS_PER_SITE)]
+        sections.append({'sis_section_id': None})
+        sections_by_site_id[site_index] = sections
+    # Enrollments in every other section, the rest in sections with no Canvas site.
+    enrollments = [{'classSection': {'id': 10000 + n * 2, 'class': {'number': '001'}}} for n in range(ENROLLMENTS)]
+
+    def sites():
+        return [{'canvasCourseId': site_id} for site_id in sections_by_site_id]
+
+    linear_sites = sites()
+    linear_merge(linear_sites, sections_by_site_id, enrollments)
+    indexed_sites = sites()
+    indexed_merge(indexed_sites, sections_by_site_id, enrollments)
+    print('{} sites, {} sections, {} enrollments, {} matched; results {}'.format(
+        SITES,
+        SITES * SECTIONS_PER_SITE,
+        ENROLLMENTS,
+        sum(len(site['sisEnrollments']) for site in indexed_sites),
+        'identical' if linear_sites == indexed_sites else 'DIFFER',
+    ))
+
+    shared_index = {site_id: merged.section_ccns(sections) for site_id, sections in sections_by_site_id.items()}
+    timings = {
+        'linear scan': lambda: linear_merge(sites(), sections_by_site_id, enrollments),
+        'ccn index': lambda: indexed_merge(sites(), sections_by_site_id, enrollments),
+        'shared ccn index': lambda: indexed_merge(sites(), sections_by_site_id, enrollments, shared_index),
+    }
+    for label, func in timings.items():
+        elapsed = timeit.timeit(func, number=RUNS) / RUNS
+        print('{:<20} {:10.3f} ms'.format(label, elapsed * 1000))
+
+
+main()
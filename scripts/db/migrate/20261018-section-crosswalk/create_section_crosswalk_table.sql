@@ -0,0 +1,16 @@
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS section_crosswalk (
+  id SERIAL NOT NULL,
+  canvas_course_id INTEGER NOT NULL,
+  canvas_section_id INTEGER NOT NULL,
+  sis_term_id VARCHAR(4),
+  ccn VARCHAR(5),
+  created_at TIMESTAMP NOT NULL,
+  updated_at TIMESTAMP NOT NULL,
+
+  PRIMARY KEY (id),
+  CONSTRAINT section_crosswalk_canvas_ids UNIQUE (canvas_course_id, canvas_section_id)
+);
+
+COMMIT;
@@ -0,0 +1,7 @@
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS team_members_member_name_id_index ON team_members ((coalesce(member_name, '')), id);
+CREATE INDEX IF NOT EXISTS team_members_member_uid_id_index ON team_members ((coalesce(member_uid, '')), id);
+CREATE INDEX IF NOT EXISTS team_members_member_csid_id_index ON team_members (member_csid, id);
+
+COMMIT;
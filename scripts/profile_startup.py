@@ -0,0 +1,46 @@
+"""Profile module imports during app startup, listing the slowest packages by cumulative import time (which includes
+the packages they import in turn) and any modules on the STARTUP_IMPORT_DENYLIST.
+
+Usage: python scripts/profile_startup.py [count]
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def main(count):
+    command = [
+        sys.executable, '-X', 'importtime', '-c',
+        'from boac.factory import create_app; app = create_app(); import json; print(json.dumps(app.config["STARTUP_IMPORT_DENYLIST"]))',
+    ]
+    result = subprocess.run(command, cwd=BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    denylist = json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])
+
+    packages = {}
+    total_us = 0
+    for line in result.stderr.decode('utf-8').splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        package = module.split('.')[0]
+        if module == package:
+            packages[package] = int(cumulative_us)
+        if len(indent) == 1:
+            total_us += int(cumulative_us)
+        if package in denylist:
+            print('Denylisted module imported at startup: {}'.format(module))
+
+    print('{:.0f} ms importing {} packages'.format(total_us / 1000, len(packages)))
+    for package, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[0:count]:
+        print('{:>8.1f} ms  {}'.format(cumulative_us / 1000, package))
+
+
+main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -71,12 +71,15 @@ def db_session(db, request):
 
     options = dict(bind=connection, binds={})
     _session = db.create_scoped_session(options=options)
+    original_session = db.session
     db.session = _session
 
     # Roll back transaction when the test is complete.
     def teardown():
         transaction.rollback()
         _session.remove()
+        connection.close()
+        db.session = original_session
 
     request.addfinalizer(teardown)
 
@@ -1,5 +1,14 @@
+import base64
+
+from boac import db
+from boac.api import result_cache
+from boac.lib import stowed_keys
+from boac.lib.cache import LRUCache
+from boac.models import json_cache
 from boac.models.authorized_user import AuthorizedUser
 from boac.models.cohort_filter import CohortFilter
+from boac.models.json_cache import JsonCache
+from boac.models.team_member import TeamMember
 import pytest
 import simplejson as json
 
@@ -61,6 +70,15 @@ class TestCohortDetail:
         assert response.json['members'][0]['uid'] == '61889'
         assert response.json['members'][0]['avatar_url'] == 'https://calspirit.berkeley.edu/oski/images/oskibio.jpg'
 
+    def test_concurrent_member_loading(self, authenticated_session, client, app, monkeypatch):
+        """returns the same members when loading them concurrently"""
+        response = client.post(TestCohortDetail.valid_api_path)
+        json_cache.clear('%canvas_%')
+        json_cache.clear('%analytics_for_course_%')
+        db.session.commit()
+        monkeypatch.setitem(app.config, 'MEMBER_PROFILE_THREADS', 4)
+        assert client.post(TestCohortDetail.valid_api_path).json == response.json
+
     def test_my_cohorts(self, authenticated_session, client):
         response = client.get('/api/cohorts/my')
         assert response.status_code == 200
@@ -155,3 +173,171 @@ class TestCohortDetail:
         assert response.status_code == 200
         cohorts = CohortFilter.all_owned_by(test_uid)
         assert not next((c for c in cohorts if c['id'] == id_of_created_cohort), None)
+
+
+class TestCohortResultCache:
+    """Cached team and cohort pages"""
+
+    @pytest.fixture(autouse=True)
+    def cache(self, monkeypatch):
+        _cache = LRUCache(max_entries=100)
+        monkeypatch.setattr(result_cache, '_cache', _cache)
+        return _cache
+
+    def test_repeat_view_cached(self, authenticated_session, client, monkeypatch):
+        """serves repeat views of a team from cache"""
+        response = client.post(TestCohortDetail.valid_api_path)
+        monkeypatch.setattr(TeamMember, 'for_code', lambda *args: pytest.fail('team reloaded'))
+        cached = client.post(TestCohortDetail.valid_api_path)
+        assert cached.status_code == 200
+        assert cached.json == response.json
+
+    def test_keyed_by_params(self, authenticated_session, client):
+        """keys cached views by query parameters"""
+        by_name = client.post(TestCohortDetail.valid_api_path).json
+        by_uid = client.post(
+            TestCohortDetail.valid_api_path,
+            data=json.dumps({'orderBy': 'member_uid'}),
+            content_type='application/json',
+        ).json
+        assert [member['uid'] for member in by_uid['members']] == sorted(member['uid'] for member in by_name['members'])
+        assert by_uid['members'] != by_name['members']
+
+    @pytest.mark.usefixtures('db_session')
+    def test_team_member_change(self, authenticated_session, client):
+        """reflects changes to team membership"""
+        client.post(TestCohortDetail.valid_api_path)
+        member = TeamMember.query.filter_by(code='FHW', member_uid='61889').first()
+        member.member_name = 'Zelda Lin'
+        db.session.flush()
+        response = client.post(TestCohortDetail.valid_api_path)
+        assert response.json['members'][-1]['name'] == 'Zelda Lin'
+
+    @pytest.mark.usefixtures('db_session')
+    def test_stowed_json_change(self, authenticated_session, client):
+        """reflects changes to stowed JSON read for the page"""
+        client.post(TestCohortDetail.valid_api_path)
+        row = JsonCache.query.filter_by(key='canvas_user_for_uid_61889').first()
+        row.set_json(dict(row.get_json(), avatar_url='https://example.com/oski.jpg'))
+        db.session.flush()
+        response = client.post(TestCohortDetail.valid_api_path)
+        member = next(member for member in response.json['members'] if member['uid'] == '61889')
+        assert member['avatar_url'] == 'https://example.com/oski.jpg'
+
+    def test_app_cache_profiles_recorded(self, app, monkeypatch):
+        """records the stowed JSON behind Canvas profiles read from the app cache"""
+        from boac.api.cohort_controller import load_canvas_profiles
+        app_cache = LRUCache(max_entries=100)
+        app_cache.set('user/61889', {'id': 61889})
+        monkeypatch.setattr(app, 'cache', app_cache, raising=False)
+        with stowed_keys.recording() as keys:
+            profiles = load_canvas_profiles(['61889'])
+        assert profiles == {'61889': {'id': 61889}}
+        assert keys == {'canvas_user_for_uid_61889'}
+
+    @pytest.mark.usefixtures('db_session')
+    def test_unrelated_change(self, authenticated_session, client, monkeypatch):
+        """is not invalidated by changes to other teams or stowed JSON"""
+        response = client.post(TestCohortDetail.valid_api_path)
+        db.session.add(TeamMember(code='WPW', member_uid='100', member_csid='1000', member_name='Adams, Abigail'))
+        json_cache.clear('canvas_user_for_uid_242881')
+        db.session.flush()
+        monkeypatch.setattr(TeamMember, 'for_code', lambda *args: pytest.fail('team reloaded'))
+        assert client.post(TestCohortDetail.valid_api_path).json == response.json
+
+    @pytest.mark.usefixtures('db_session')
+    def test_saved_cohort_change(self, authenticated_session, client):
+        """reflects changes to a saved cohort and the members of its teams"""
+        cohort_id = AuthorizedUser.find_by_uid(test_uid).cohort_filters[0].id
+        api_path = '/api/cohort/{}'.format(cohort_id)
+        client.post(api_path)
+        CohortFilter.update(cohort_id=cohort_id, label='Renamed')
+        assert client.post(api_path).json['label'] == 'Renamed'
+        before = client.post(api_path).json['totalMemberCount']
+        team_code = json.loads(CohortFilter.query.get(cohort_id).filter_criteria)['teams'][0]
+        db.session.add(TeamMember(code=team_code, member_uid='100', member_csid='1000', member_name='Adams, Abigail'))
+        db.session.flush()
+        assert client.post(api_path).json['totalMemberCount'] == before + 1
+
+
+class TestTeamsMembers:
+    """Team members API"""
+
+    api_path = '/api/teams/members'
+
+    @staticmethod
+    def get_page(client, **params):
+        params = dict({'teamCodes': ['FHW', 'WPW'], 'limit': 1}, **params)
+        return client.post(TestTeamsMembers.api_path, data=json.dumps(params), content_type='application/json')
+
+    def walk_pages(self, client, **params):
+        pages = [self.get_page(client, **params).json]
+        while pages[-1]['nextCursor']:
+            pages.append(self.get_page(client, cursor=pages[-1]['nextCursor'], **params).json)
+        return pages
+
+    def test_distinct_members(self, authenticated_session, client):
+        """lists each student once, however many of the teams they belong to"""
+        response = self.get_page(client, limit=50)
+        assert response.status_code == 200
+        assert response.json['teams'] == [
+            {'code': 'FHW', 'name': 'Field Hockey - Women'},
+            {'code': 'WPW', 'name': 'Water Polo - Women'},
+        ]
+        assert [member['name'] for member in response.json['members']] == ['Brigitte Lin', 'Cooper, Terry', 'Garza, Isabel', 'Lin, Brigitte']
+        assert response.json['totalMemberCount'] == 4
+        assert response.json['nextCursor'] is None
+
+    def test_cursor_pages(self, authenticated_session, client):
+        """pages by cursor through the same members as by offset"""
+        for order_by in ['member_name', 'member_uid']:
+            pages = self.walk_pages(client, orderBy=order_by)
+            assert len(pages) == 4
+            assert all(page['totalMemberCount'] == 4 for page in pages)
+            offset_pages = [self.get_page(client, orderBy=order_by, offset=offset).json for offset in range(4)]
+            assert [page['members'] for page in pages] == [page['members'] for page in offset_pages]
+
+    @pytest.mark.usefixtures('db_session')
+    def test_cursor_stable(self, authenticated_session, client):
+        """is not shifted by members added before the cursor"""
+        first_page = self.get_page(client).json
+        db.session.add(TeamMember(code='WPW', member_uid='100', member_csid='1000', member_name='Adams, Abigail'))
+        db.session.flush()
+        second_page = self.get_page(client, cursor=first_page['nextCursor']).json
+        assert second_page['members'][0]['name'] == 'Cooper, Terry'
+
+    def test_invalid_cursor(self, authenticated_session, client):
+        """rejects a malformed cursor, or one issued for other teams or another order"""
+        assert self.get_page(client, cursor='not a cursor').status_code == 400
+        cursor = self.get_page(client).json['nextCursor']
+        assert self.get_page(client, cursor=cursor, orderBy='member_uid').status_code == 400
+        assert self.get_page(client, cursor=cursor, teamCodes=['FHW']).status_code == 400
+        assert self.get_page(client, cursor=cursor, teamCodes=['WPW', 'FHW']).status_code == 200
+        mistyped = base64.urlsafe_b64encode(json.dumps([['FHW', 'WPW'], 'member_name', {}, 1, 4]).encode()).decode()
+        assert self.get_page(client, cursor=mistyped).status_code == 400
+
+    def test_invalid_limit(self, authenticated_session, client):
+        """rejects a negative or non-integer page limit"""
+        for limit in [-1, '10', True]:
+            assert self.get_page(client, limit=limit).status_code == 400
+        api_path = '/api/cohort/{}'.format(AuthorizedUser.find_by_uid(test_uid).cohort_filters[0].id)
+        response = client.post(api_path, data=json.dumps({'limit': -1}), content_type='application/json')
+        assert response.status_code == 400
+
+    def test_default_limit(self, authenticated_session, client):
+        """falls back to the default page limit when none is given"""
+        default_page = self.get_page(client, limit=None).json
+        assert len(default_page['members']) > 1
+        assert self.get_page(client, limit=0).json == default_page
+
+    def test_saved_cohort_cursor(self, authenticated_session, client):
+        """pages saved cohorts by cursor"""
+        api_path = '/api/cohort/{}'.format(AuthorizedUser.find_by_uid(test_uid).cohort_filters[0].id)
+        first_page = client.post(api_path, data=json.dumps({'limit': 1}), content_type='application/json').json
+        second_page = client.post(
+            api_path,
+            data=json.dumps({'limit': 1, 'cursor': first_page['nextCursor']}),
+            content_type='application/json',
+        ).json
+        assert second_page['totalMemberCount'] == first_page['totalMemberCount']
+        assert second_page['members'][0]['uid'] != first_page['members'][0]['uid']
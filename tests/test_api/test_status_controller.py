@@ -15,3 +15,14 @@ class TestStatusController:
         assert response.status_code == 200
         assert response.json['authenticated_as']['is_authenticated']
         assert response.json['authenticated_as']['uid'] == test_uid
+
+    def test_cache_status_not_authenticated(self, client):
+        """requires authentication for cache stats"""
+        assert client.get('/api/status/cache').status_code == 401
+
+    def test_cache_status(self, client, fake_auth):
+        """reports cache stats"""
+        fake_auth.login('1133399')
+        response = client.get('/api/status/cache')
+        assert response.status_code == 200
+        assert set(response.json) == {'app_cache', 'json_cache_lru', 'result_cache'}
@@ -191,3 +191,27 @@ class TestUserAnalytics:
             assert response.status_code == 200
             assert response.json['canvasProfile']
             assert not response.json['sisProfile']
+
+    def test_partial_results(self, authenticated_session, client, monkeypatch):
+        """returns partial results when some fetches fail"""
+        from boac.api import user_controller
+
+        def broken(*args):
+            raise Exception('Connection reset')
+        monkeypatch.setattr(user_controller, 'merge_sis_profile', broken)
+        monkeypatch.setattr(user_controller, 'merge_analytics_for_user', broken)
+        response = client.get(TestUserAnalytics.field_hockey_star)
+        assert response.status_code == 200
+        assert response.json['incomplete'] == ['analytics', 'sis_profile']
+        assert response.json['sisProfile'] is False
+        course_with_enrollment = TestUserAnalytics.get_course_for_code(response, 'MED ST 205')
+        assert course_with_enrollment['analytics'] == {'error': 'Unable to retrieve analytics'}
+        assert course_with_enrollment['sisEnrollments']
+
+    def test_concurrent_fetches(self, authenticated_response, authenticated_session, client, app, monkeypatch):
+        """returns the same results when fetches run concurrently"""
+        monkeypatch.setitem(app.config, 'USER_ANALYTICS_THREADS', 4)
+        response = client.get(TestUserAnalytics.field_hockey_star)
+        assert response.status_code == 200
+        assert response.json['incomplete'] == []
+        assert response.json == authenticated_response.json
@@ -1,5 +1,6 @@
 import boac.externals.canvas as canvas
 from boac.lib.mockingbird import MockResponse, register_mock
+import pytest
 
 
 class TestCanvasGetCourseSections:
@@ -137,6 +138,13 @@ class TestCanvasGetStudentSummariesForCourse:
         assert student_summaries[729]['id'] == 9000729
         assert student_summaries[729]['page_views'] == 400
 
+    def test_pages_fetched_concurrently(self, app, monkeypatch):
+        """assembles pages fetched concurrently in order, as when fetched one at a time"""
+        student_summaries = canvas._get_student_summaries(7654321)
+        assert [summary['id'] for summary in student_summaries] == list(range(9000000, 9000730))
+        monkeypatch.setitem(app.config, 'CANVAS_PAGE_THREADS', 1)
+        assert canvas._get_student_summaries(7654321) == student_summaries
+
     def test_course_not_found(self, app, caplog):
         """logs 404 for unknown course"""
         student_summaries = canvas.get_student_summaries(9999999)
@@ -150,3 +158,24 @@ class TestCanvasGetStudentSummariesForCourse:
             student_summaries = canvas._get_student_summaries(7654321)
             assert 'HTTP/1.1" 503' in caplog.text
             assert not student_summaries
+
+
+@pytest.mark.usefixtures('db_session')
+class TestCanvasPagedFeed:
+    """Canvas API paged feed, streamed"""
+
+    def test_iter_student_summaries(self, app, monkeypatch):
+        """yields items one page at a time, in order, however many pages are fetched at once"""
+        for page_threads in [1, 3]:
+            monkeypatch.setitem(app.config, 'CANVAS_PAGE_THREADS', page_threads)
+            feed = canvas.iter_student_summaries(7654321)
+            pages = list(feed.pages())
+            assert len(pages) == 8
+            assert not feed.failed
+            assert [summary['id'] for summary in canvas.iter_student_summaries(7654321)] == list(range(9000000, 9000730))
+
+    def test_failed(self, app):
+        """stops and flags failure when a page cannot be fetched"""
+        feed = canvas.iter_student_summaries(9999999)
+        assert list(feed) == []
+        assert feed.failed
@@ -0,0 +1,114 @@
+from boac.externals import canvas
+from boac.lib import analytics
+from boac.models import json_cache
+from boac.models.json_cache import JsonCache
+import pytest
+
+
+@pytest.mark.usefixtures('db_session')
+class TestCourseAnalytics:
+    """Precomputed course analytics"""
+
+    def test_course_analytics_stowed(self, app):
+        """stows course analytics under a term-scoped key"""
+        course_analytics = analytics.course_analytics(7654321)
+        assert JsonCache.query.filter(JsonCache.key.like('term_%-analytics_for_course_7654321')).count() == 1
+        assert len(course_analytics['students']) == len(canvas.get_student_summaries(7654321))
+        assert course_analytics['assignmentsOnTime']['courseDeciles'][10] == 6.0
+        assert course_analytics['pageViews']['mean'] > 0
+
+    def test_stowed_while_streaming_summaries(self, app, monkeypatch):
+        """stows summaries and analytics from a single pass over the summary feed"""
+        summaries = canvas.get_student_summaries(7654321)
+        expected = analytics.analytics_for_course(summaries)
+        json_cache.clear('term_%-canvas_student_summaries_for_course_7654321')
+        json_cache.clear('term_%-analytics_for_course_7654321')
+        get_student_summaries = canvas.get_student_summaries
+
+        def reread(course_id):
+            pytest.fail('summaries reread')
+        reread.stow_key = get_student_summaries.stow_key
+        reread.stow_ttl = get_student_summaries.stow_ttl
+        monkeypatch.setattr(canvas, 'get_student_summaries', reread)
+        assert analytics.stow_course_summaries_and_analytics(7654321)
+        assert analytics.course_analytics(7654321) == expected
+        assert len(json_cache.get_many([get_student_summaries.stow_key(7654321)])) == 1
+        assert not analytics.stow_course_summaries_and_analytics(9999999)
+
+    def test_student_lookup(self, app):
+        """returns the same analytics for a student as computation from the summary feed"""
+        summaries = canvas.get_student_summaries(7654321)
+        course_analytics = analytics.course_analytics(7654321)
+        course = {'id': 7654321}
+        for canvas_user_id in [summaries[0]['id'], summaries[-1]['id']]:
+            looked_up = analytics.student_analytics(course_analytics, canvas_user_id, course)
+            assert looked_up == analytics.analytics_from_summary_feed(summaries, canvas_user_id, course)
+            assert looked_up['participations']['student']['percentile'] is not None
+
+    def test_student_not_found(self, app):
+        """returns an error for a student not enrolled in the course"""
+        course_analytics = analytics.course_analytics(7654321)
+        assert analytics.student_analytics(course_analytics, 1, {'id': 7654321}) == {'error': 'Unable to retrieve analytics'}
+
+    def test_cohort_analytics(self, app, monkeypatch):
+        """analyzes a course shared by many users once, with the same results as analysis per user"""
+        canvas_user_ids = [summary['id'] for summary in canvas.get_student_summaries(7654321)[0:5]]
+        json_cache.clear('term_%-analytics_for_course_%')
+        analyzed = []
+        analytics_for_course = analytics.analytics_for_course
+        monkeypatch.setattr(analytics, 'analytics_for_course', lambda feed: analyzed.append(1) or analytics_for_course(feed))
+
+        def user_courses():
+            return [{'id': 7654321, 'canvasCourseId': 7654321}, {'id': 7654320, 'canvasCourseId': 7654320}]
+        users_courses = [(user_courses(), canvas_user_id) for canvas_user_id in canvas_user_ids]
+        all_mean_analytics = analytics.mean_course_analytics_for_users(users_courses)
+        assert len(analyzed) == 1
+        for (courses, canvas_user_id), mean_analytics in zip(users_courses, all_mean_analytics):
+            assert courses[0]['analytics']['pageViews']['student']['percentile'] == mean_analytics['pageViews']
+            assert courses[1]['analytics'] == {'error': 'Unable to retrieve analytics'}
+            assert analytics.mean_course_analytics_for_user(user_courses(), canvas_user_id) == mean_analytics
+
+    def test_undefined_values(self):
+        """stores undefined zscores as None rather than NaN"""
+        summary_feed = [{'id': 1, 'page_views': 3, 'participations': 0, 'tardiness_breakdown': {'on_time': 1}}]
+        course_analytics = analytics.analytics_for_course(summary_feed)
+        assert course_analytics['pageViews']['stdDev'] == 0
+        assert course_analytics['students']['1']['pageViews'] == {'raw': 3, 'zscore': None, 'percentile': None}
+
+
+class TestAnalyticsForCourse:
+    """Vectorized course analytics"""
+
+    summary_feed = [
+        {'id': 1, 'page_views': 10, 'participations': 2, 'tardiness_breakdown': {'on_time': 4}},
+        {'id': 2, 'page_views': 20, 'participations': None, 'tardiness_breakdown': {'on_time': 2}},
+        {'id': 3, 'page_views': 30, 'tardiness_breakdown': {'on_time': 0}},
+        {'id': 4, 'page_views': 40, 'participations': 6, 'tardiness_breakdown': {'on_time': 2}},
+    ]
+
+    def test_deciles(self):
+        """interpolates deciles linearly between values"""
+        course_analytics = analytics.analytics_for_course(self.summary_feed)
+        assert course_analytics['pageViews']['courseDeciles'] == pytest.approx([10, 13, 16, 19, 22, 25, 28, 31, 34, 37, 40])
+        assert course_analytics['pageViews']['mean'] == 25
+        assert course_analytics['pageViews']['stdDev'] == pytest.approx(11.18, 0.01)
+
+    def test_student_values(self):
+        """computes population zscores and percentiles for every student"""
+        students = analytics.analytics_for_course(self.summary_feed)['students']
+        assert students['1']['assignmentsOnTime'] == {'raw': 4, 'zscore': pytest.approx(1.414, 0.01), 'percentile': pytest.approx(92.1, 0.1)}
+        assert students['2']['assignmentsOnTime']['zscore'] == 0
+        assert students['2']['assignmentsOnTime']['percentile'] == 50
+
+    def test_missing_values(self):
+        """fills missing values with zero, as floats"""
+        students = analytics.analytics_for_course(self.summary_feed)['students']
+        assert [students[str(i)]['participations']['raw'] for i in range(1, 5)] == [2.0, 0.0, 0.0, 6.0]
+        assert isinstance(students['1']['participations']['raw'], float)
+        assert isinstance(students['1']['pageViews']['raw'], int)
+
+    def test_empty_feed(self):
+        """returns undefined statistics for a course without students"""
+        course_analytics = analytics.analytics_for_course([])
+        assert course_analytics['students'] == {}
+        assert course_analytics['pageViews'] == {'courseDeciles': [None] * 11, 'mean': None, 'stdDev': None}
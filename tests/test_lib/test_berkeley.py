@@ -18,3 +18,20 @@ class TestBerkeleySisTermIdForName:
     def test_missing_term_name(self):
         """returns None for missing term names"""
         assert berkeley.sis_term_id_for_name(None) is None
+
+
+class TestBerkeleyParseSisSectionId:
+    """Canvas SIS section ID parsing"""
+
+    def test_parse_sis_section_id(self):
+        """extracts the SIS term id and CCN of official sections"""
+        assert berkeley.parse_sis_section_id('SEC:2015-B-12345') == ('2152', '12345')
+        assert berkeley.parse_sis_section_id('SEC:2016-C-00123') == ('2165', '00123')
+        assert berkeley.parse_sis_section_id('SEC:2017-D-90200-88CA51BE') == ('2178', '90200')
+
+    def test_unofficial_sections(self):
+        """returns None for manually created sections"""
+        assert berkeley.parse_sis_section_id('SEC:2017-A-90200') is None
+        assert berkeley.parse_sis_section_id('Manual section') is None
+        assert berkeley.parse_sis_section_id('') is None
+        assert berkeley.parse_sis_section_id(None) is None
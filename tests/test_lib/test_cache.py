@@ -0,0 +1,244 @@
+import socketserver
+import threading
+import time
+
+from boac.lib.cache import cache_from_config, FileSystemCache, LRUCache, RedisCache, RedisError
+import pytest
+
+
+class TestLRUCache:
+    """In-process LRU cache"""
+
+    def test_get_and_set(self):
+        """returns stored values, including falsey ones"""
+        cache = LRUCache(max_entries=10)
+        cache.set('a', {'id': 1})
+        cache.set('b', False)
+        assert cache.get('a') == {'id': 1}
+        assert cache.get('b', 'missing') is False
+        assert cache.get('c', 'missing') == 'missing'
+        assert cache.stats()['hits'] == 2
+        assert cache.stats()['misses'] == 1
+
+    def test_evicts_least_recently_used(self):
+        """evicts least recently used entries beyond the entry limit"""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert cache.stats()['evictions'] == 1
+
+    def test_byte_limit(self):
+        """evicts entries beyond the byte limit and skips oversized values"""
+        cache = LRUCache(max_entries=100, max_bytes=30)
+        cache.set('a', 'x' * 10)
+        cache.set('b', 'y' * 10)
+        cache.set('c', 'z' * 10)
+        assert cache.get('a') is None
+        assert cache.stats()['bytes'] <= 30
+        cache.set('d', 'w' * 100)
+        assert cache.get('d') is None
+        assert cache.get('c') == 'z' * 10
+
+    def test_ttl(self):
+        """treats expired entries as missing"""
+        cache = LRUCache(max_entries=10, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+        assert cache.stats()['expirations'] == 1
+        assert cache.stats()['entries'] == 0
+
+    def test_delete_matching(self):
+        """deletes entries by key predicate"""
+        cache = LRUCache(max_entries=10)
+        cache.set('term_Fall 2017-a', 1)
+        cache.set('term_Fall 2017-b', 2)
+        cache.set('c', 3)
+        assert cache.delete_matching(lambda key: key.startswith('term_')) == 2
+        assert cache.stats()['entries'] == 1
+        assert cache.get('c') == 3
+
+    def test_entry_ttl(self):
+        """applies the shorter of cache-wide and per-entry ttl"""
+        cache = LRUCache(max_entries=10, ttl=60)
+        cache.set('a', 1, ttl=0.01)
+        cache.set('b', 2)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+
+
+class TestFileSystemCache:
+    """File system cache shared across processes"""
+
+    def test_get_and_set(self, tmpdir):
+        """returns stored values, including falsey ones, to any instance on the same directory"""
+        cache = FileSystemCache(str(tmpdir), max_entries=10)
+        cache.set('user/2040', {'id': 1})
+        cache.set('b', False)
+        other_process_cache = FileSystemCache(str(tmpdir), max_entries=10)
+        assert other_process_cache.get('user/2040') == {'id': 1}
+        assert other_process_cache.get('b', 'missing') is False
+        assert other_process_cache.get('c', 'missing') == 'missing'
+        assert other_process_cache.stats()['hits'] == 2
+        assert other_process_cache.stats()['misses'] == 1
+        assert other_process_cache.stats()['entries'] == 2
+
+    def test_evicts_oldest(self, tmpdir):
+        """evicts the least recently written entries beyond the entry limit"""
+        cache = FileSystemCache(str(tmpdir), max_entries=2)
+        for key in ['a', 'b', 'c']:
+            cache.set(key, key)
+            time.sleep(0.01)
+        assert cache.get('a') is None
+        assert cache.get('c') == 'c'
+        assert cache.stats()['evictions'] == 1
+        assert cache.stats()['entries'] == 2
+
+    def test_ttl(self, tmpdir):
+        """treats expired entries as missing"""
+        cache = FileSystemCache(str(tmpdir), max_entries=10, ttl=60)
+        cache.set('a', 1, ttl=0.01)
+        cache.set('b', 2)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        assert cache.stats()['expirations'] == 1
+
+    def test_delete_and_clear(self, tmpdir):
+        cache = FileSystemCache(str(tmpdir), max_entries=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete('a')
+        assert cache.get('a') is None
+        cache.clear()
+        assert cache.stats()['entries'] == 0
+
+    def test_prunes_periodically(self, tmpdir):
+        """prunes after every tenth of the entry limit in writes, down to that many writes short of the limit"""
+        cache = FileSystemCache(str(tmpdir), max_entries=20)
+        for key in range(21):
+            cache.set(str(key), key)
+            time.sleep(0.01)
+        assert cache.stats()['entries'] == 20
+        cache.set('21', 21)
+        assert cache.stats()['entries'] == 19
+        assert cache.stats()['evictions'] == 3
+        assert cache.get('0') is None
+        assert cache.get('21') == 21
+
+    def test_file_system_errors(self, app, tmpdir):
+        """misses and drops writes rather than failing when the directory is unusable"""
+        cache = FileSystemCache(str(tmpdir.join('cache')), max_entries=10)
+        tmpdir.join('cache').remove()
+        cache.set('a', 1)
+        assert cache.get('a') is None
+        assert cache.stats()['errors'] == 1
+        assert cache.stats()['misses'] == 1
+
+
+class StandInRedisHandler(socketserver.StreamRequestHandler):
+    """Serves the few Redis commands used by RedisCache from a dict, ignoring expiry."""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for n in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.reply(args[0].upper(), args[1:]))
+
+    def reply(self, command, args):
+        data = self.server.data
+        if command == b'GET':
+            value = data.get(args[0])
+            return b'$-1\r\n' if value is None else b'$' + str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+        elif command == b'SET':
+            data[args[0]] = args[1]
+            self.server.expiries[args[0]] = args[3] if len(args) > 3 else None
+            return b'+OK\r\n'
+        elif command == b'DEL':
+            return ':{}\r\n'.format(int(data.pop(args[0], None) is not None)).encode()
+        elif command == b'INFO':
+            info = b'# Stats\r\nevicted_keys:3\r\n'
+            return b'$' + str(len(info)).encode() + b'\r\n' + info + b'\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+@pytest.fixture()
+def redis_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StandInRedisHandler)
+    server.daemon_threads = True
+    server.data = {}
+    server.expiries = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestRedisCache:
+    """Redis protocol cache"""
+
+    @staticmethod
+    def cache(server, **kwargs):
+        return RedisCache('redis://127.0.0.1:{}/0'.format(server.server_address[1]), **kwargs)
+
+    def test_get_and_set(self, app, redis_server):
+        """stores JSON values under a key prefix"""
+        cache = self.cache(redis_server, ttl=600)
+        cache.set('user/2040', {'id': 1})
+        cache.set('b', False)
+        assert redis_server.data[b'boac:user/2040'] == b'{"id": 1}'
+        assert redis_server.expiries[b'boac:user/2040'] == b'600'
+        assert self.cache(redis_server).get('user/2040') == {'id': 1}
+        assert cache.get('b', 'missing') is False
+        assert cache.get('c', 'missing') == 'missing'
+        cache.delete('user/2040')
+        assert cache.get('user/2040') is None
+        assert cache.stats() == {'hits': 1, 'misses': 2, 'errors': 0, 'evictions': 3}
+
+    def test_error_reply(self, app, redis_server):
+        """raises error replies"""
+        with pytest.raises(RedisError):
+            self.cache(redis_server).command('FLUSHALL')
+
+    def test_unreachable(self, app, redis_server):
+        """misses rather than failing when the server is unreachable"""
+        cache = self.cache(redis_server)
+        cache.set('a', 1)
+        redis_server.shutdown()
+        redis_server.server_close()
+        unreachable = RedisCache('redis://127.0.0.1:1/0')
+        unreachable.set('a', 1)
+        assert unreachable.get('a') is None
+        assert unreachable.stats()['errors'] == 3
+
+
+class TestCacheFromConfig:
+    """App cache backend selection"""
+
+    def test_backends(self, tmpdir):
+        config = {
+            'CACHE_DEFAULT': 600,
+            'CACHE_MAX_ENTRIES': 100,
+            'CACHE_DIR': str(tmpdir),
+            'CACHE_REDIS_URL': 'redis://localhost:6379/1',
+        }
+        assert isinstance(cache_from_config(dict(config, CACHE_BACKEND='lru')), LRUCache)
+        assert isinstance(cache_from_config(dict(config, CACHE_BACKEND='filesystem')), FileSystemCache)
+        redis_cache = cache_from_config(dict(config, CACHE_BACKEND='redis'))
+        assert (redis_cache.host, redis_cache.port, redis_cache.db, redis_cache.ttl) == ('localhost', 6379, 1, 600)
+        with pytest.raises(ValueError):
+            cache_from_config(dict(config, CACHE_BACKEND='memcached'))
+
+    def test_disabled(self):
+        assert cache_from_config({'CACHE_DEFAULT': False, 'CACHE_BACKEND': 'lru'}) is None
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from boac.lib import concurrency, stowed_keys
+from flask import current_app
+import pytest
+
+
+class TestMapInAppContext:
+    """Bounded thread pool in app context"""
+
+    def test_results_in_order(self, app):
+        """returns results in item order"""
+        assert concurrency.map_in_app_context(lambda n: n * n, range(20), 4) == [n * n for n in range(20)]
+
+    def test_app_context(self, app):
+        """runs each call with access to app config"""
+        results = concurrency.map_in_app_context(lambda key: current_app.config[key], ['TESTING', 'BOAC_ENV'], 2)
+        assert results == [True, 'test']
+
+    def test_serial(self, app):
+        """runs serially given a single worker"""
+        assert concurrency.map_in_app_context(str, [1, 2, 3], 1) == ['1', '2', '3']
+
+    def test_records_stowed_keys(self, app):
+        """records stowed JSON keys read by worker threads for the caller"""
+        with stowed_keys.recording() as keys:
+            concurrency.map_in_app_context(lambda n: stowed_keys.record(['key_{}'.format(n)]), range(4), 4)
+            concurrency.run_task_graph({'a': (lambda: stowed_keys.record(['key_a']), [])}, 4, 5)
+        assert keys == {'key_0', 'key_1', 'key_2', 'key_3', 'key_a'}
+
+    @pytest.mark.usefixtures('db_session')
+    def test_serial_on_shared_connection(self, app):
+        """runs serially when the DB session is bound to a single connection"""
+        threads = concurrency.map_in_app_context(lambda n: threading.get_ident(), range(4), 4)
+        assert threads == [threading.get_ident()] * 4
+        tasks = {name: (threading.get_ident, []) for name in ['a', 'b']}
+        assert set(concurrency.run_task_graph(tasks, 4, 5).values()) == {threading.get_ident()}
+
+
+class TestRunTaskGraph:
+    """Dependency-aware concurrent tasks"""
+
+    def test_dependencies(self, app):
+        """passes the results of dependencies to dependent tasks"""
+        tasks = {
+            'sum': (lambda a, b: a + b, ['a', 'b']),
+            'a': (lambda: 1, []),
+            'b': (lambda: 2, []),
+            'double': (lambda total: total * 2, ['sum']),
+        }
+        for max_workers in [1, 4]:
+            assert concurrency.run_task_graph(tasks, max_workers, 5) == {'a': 1, 'b': 2, 'sum': 3, 'double': 6}
+
+    def test_concurrent(self, app):
+        """runs independent tasks concurrently, in app context"""
+        barrier = threading.Barrier(3, timeout=5)
+
+        def meet():
+            barrier.wait()
+            return current_app.config['TESTING']
+        tasks = {name: (meet, []) for name in ['a', 'b', 'c']}
+        assert concurrency.run_task_graph(tasks, 3, 5) == {'a': True, 'b': True, 'c': True}
+
+    def test_failure(self, app):
+        """leaves out failed tasks and their dependents"""
+        tasks = {
+            'ok': (lambda: 'ok', []),
+            'broken': (lambda: 1 / 0, []),
+            'dependent': (lambda value: value, ['broken']),
+        }
+        for max_workers in [1, 4]:
+            assert concurrency.run_task_graph(tasks, max_workers, 5) == {'ok': 'ok'}
+
+    def test_deadline(self, app):
+        """returns partial results at the deadline"""
+        release = threading.Event()
+        tasks = {
+            'fast': (lambda: 'fast', []),
+            'slow': (lambda: release.wait(5), []),
+            'after_slow': (lambda value: value, ['slow']),
+        }
+        started_at = time.monotonic()
+        try:
+            assert concurrency.run_task_graph(tasks, 2, 0.2) == {'fast': 'fast'}
+            assert time.monotonic() - started_at < 1
+        finally:
+            release.set()
+
+    def test_serial_deadline(self, app):
+        """starts no task after the deadline when serial"""
+        tasks = {
+            'slow': (lambda: time.sleep(0.2) or 'slow', []),
+            'after_slow': (lambda value: value, ['slow']),
+        }
+        assert concurrency.run_task_graph(tasks, 1, 0.1) == {'slow': 'slow'}
+
+
+class TestSingleFlight:
+    """Single-flight call coalescing"""
+
+    def test_coalesces_concurrent_calls(self):
+        """runs one call per key for concurrent callers, sharing its result"""
+        single_flight = concurrency.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch(key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return {'key': key}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(single_flight.do, 'a', fetch, 'a')
+            started.wait(5)
+            followers = [executor.submit(single_flight.do, 'a', fetch, 'a') for i in range(3)]
+            time.sleep(0.05)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+        assert calls == ['a']
+        assert results == [{'key': 'a'}] * 4
+
+    def test_sequential_calls(self):
+        """runs sequential calls separately"""
+        single_flight = concurrency.SingleFlight()
+        assert single_flight.do('a', lambda: 1) == 1
+        assert single_flight.do('a', lambda: 2) == 2
+
+    def test_exception(self):
+        """raises the leader's exception"""
+        single_flight = concurrency.SingleFlight()
+        with pytest.raises(ValueError):
+            single_flight.do('a', int, 'not a number')
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from boac.lib import concurrency, deadline
+from flask import jsonify
+
+
+class TestDeadline:
+    """Request-scoped deadlines"""
+
+    def test_no_deadline(self):
+        """has no time limit by default"""
+        assert deadline.current() is None
+        assert deadline.remaining() is None
+
+    def test_limit(self):
+        """limits the time remaining within a block"""
+        with deadline.limit(10):
+            assert 9 < deadline.remaining() <= 10
+        assert deadline.remaining() is None
+
+    def test_earlier_deadline_applies(self):
+        """keeps an earlier deadline in effect within a later one"""
+        with deadline.limit(1):
+            with deadline.limit(60):
+                assert deadline.remaining() <= 1
+            with deadline.limit(0.5):
+                assert deadline.remaining() <= 0.5
+            with deadline.at(None):
+                assert deadline.remaining() <= 1
+            assert 0.5 < deadline.remaining() <= 1
+
+    def test_start_and_clear(self):
+        """sets and clears a deadline outside a block"""
+        deadline.start(5)
+        try:
+            assert 4 < deadline.remaining() <= 5
+        finally:
+            deadline.clear()
+        assert deadline.current() is None
+
+    def test_per_thread(self):
+        """applies only to the thread that set it"""
+        remaining = []
+        with deadline.limit(5):
+            thread = threading.Thread(target=lambda: remaining.append(deadline.remaining()))
+            thread.start()
+            thread.join()
+        assert remaining == [None]
+
+    def test_carried_into_workers(self, app):
+        """is carried into pooled worker threads"""
+        with deadline.limit(5):
+            expected = deadline.current()
+            assert concurrency.map_in_app_context(lambda n: deadline.current(), range(4), 2) == [expected] * 4
+        results = concurrency.run_task_graph({'current': (deadline.current, [])}, 2, 60)
+        assert time.monotonic() + 50 < results['current'] <= time.monotonic() + 60
+
+    def test_api_request_deadline(self, app, monkeypatch):
+        """is set for the duration of each API request"""
+        remaining = []
+
+        def app_status():
+            remaining.append(deadline.remaining())
+            return jsonify({})
+        monkeypatch.setitem(app.view_functions, 'app_status', app_status)
+        monkeypatch.setitem(app.config, 'REQUEST_DEADLINE', 10)
+        # Unlike the client fixture, a plain test client tears the request context down as soon as it responds.
+        assert app.test_client().get('/api/status').status_code == 200
+        assert 9 < remaining[0] <= 10
+        assert deadline.current() is None
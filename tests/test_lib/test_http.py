@@ -0,0 +1,206 @@
+import threading
+import time
+
+import boac.externals.canvas as canvas
+from boac.lib import deadline, http
+from boac.lib.mockingbird import MockResponse, register_mock
+from boac.lib.rate_limit import TokenBucket
+import requests
+
+
+class TestHttpSessions:
+    """Pooled HTTP sessions"""
+
+    def test_session_per_host(self, app):
+        """shares one session per scheme and host"""
+        session = http.get_session('https://bcourses.berkeley.edu/api/v1/users/sis_login_id:2040')
+        assert session is http.get_session('https://bcourses.berkeley.edu/api/v1/courses/7654320/sections?per_page=100')
+        assert session is not http.get_session('https://secreturl.berkeley.edu/students/11667051/all')
+        assert session is not http.get_session('http://bcourses.berkeley.edu/api/v1/users/sis_login_id:2040')
+
+    def test_connection_stats(self, app):
+        """counts requests and opened connections per host"""
+        canvas._get_user_for_uid(2040)
+        canvas._get_user_for_uid(242881)
+        stats = http.connection_stats()['https://bcourses.berkeley.edu']
+        assert stats['requests'] >= 2
+        assert stats['opened'] >= 1
+        assert stats['reused'] == stats['requests'] - stats['opened']
+
+
+class TestPaging:
+    """Paged responses"""
+
+    @staticmethod
+    def response(url, link):
+        response = requests.Response()
+        response.url = url
+        response.headers['Link'] = link
+        return response
+
+    def test_remaining_page_urls(self):
+        """lists the pages following the current one up to the last"""
+        response = self.response(
+            'https://bcourses.berkeley.edu/api/v1/courses/1/sections?per_page=100',
+            '<https://bcourses.berkeley.edu/api/v1/courses/1/sections?page=2&per_page=100>; rel="next", '
+            '<https://bcourses.berkeley.edu/api/v1/courses/1/sections?page=3&per_page=100>; rel="last"',
+        )
+        assert http.get_remaining_page_urls(response) == [
+            'https://bcourses.berkeley.edu/api/v1/courses/1/sections?page=2&per_page=100',
+            'https://bcourses.berkeley.edu/api/v1/courses/1/sections?page=3&per_page=100',
+        ]
+
+    def test_single_page(self):
+        """lists no pages when the current page is the last"""
+        url = 'https://bcourses.berkeley.edu/api/v1/courses/1/sections?page=1&per_page=100'
+        assert http.get_remaining_page_urls(self.response(url, '<{}>; rel="last"'.format(url))) == []
+
+    def test_last_page_unknown(self):
+        """returns None without a numbered last page"""
+        url = 'https://bcourses.berkeley.edu/api/v1/courses/1/sections?per_page=100'
+        assert http.get_remaining_page_urls(self.response(url, '<{}&page=2>; rel="next"'.format(url))) is None
+        bookmarked = '<{}&page=bookmark:WzEwMF0>; rel="last"'.format(url)
+        assert http.get_remaining_page_urls(self.response(url, bookmarked)) is None
+
+
+class ResponseSequence:
+    """Mock response body serving the given MockResponses in turn, then repeating the last."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def __call__(self, *args):
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        return response(*args)
+
+
+class TestRetries:
+    """HTTP retries"""
+
+    @staticmethod
+    def get_user(*responses):
+        before = http.upstream_stats().get('canvas', {})
+        with register_mock(canvas._get_user_for_uid, lambda *args: ResponseSequence(*responses)):
+            response = canvas._get_user_for_uid(2040)
+        after = http.upstream_stats()['canvas']
+        counts = {counter: after[counter] - before.get(counter, 0) for counter in after}
+        del counts['rate_limit_waits']
+        return response, counts
+
+    def test_server_error_retried(self, app):
+        """retries server errors"""
+        response, counts = self.get_user(MockResponse(503, {}, '{}'), MockResponse(200, {}, '{"id": 1}'))
+        assert response.json() == {'id': 1}
+        assert counts == {'requests': 2, 'retries': 1, 'failures': 0, 'rate_limited': 0}
+
+    def test_client_error_not_retried(self, app):
+        """does not retry client errors"""
+        response, counts = self.get_user(MockResponse(404, {}, '{}'), MockResponse(200, {}, '{"id": 1}'))
+        assert not response
+        assert response.raw_response.status_code == 404
+        assert counts == {'requests': 1, 'retries': 0, 'failures': 1, 'rate_limited': 0}
+
+    def test_gives_up(self, app):
+        """gives up after the configured number of retries"""
+        response, counts = self.get_user(MockResponse(500, {}, '{}'))
+        assert not response
+        assert response.raw_response.status_code == 500
+        assert counts['requests'] == app.config['HTTP_RETRIES'] + 1
+        assert counts['failures'] == 1
+
+    def test_canvas_rate_limit(self, app):
+        """retries when Canvas reports its rate limit exceeded"""
+        throttled = MockResponse(403, {'X-Rate-Limit-Remaining': '0.0'}, '403 Forbidden (Rate Limit Exceeded)')
+        response, counts = self.get_user(throttled, MockResponse(200, {}, '{"id": 1}'))
+        assert response
+        assert counts == {'requests': 2, 'retries': 1, 'failures': 0, 'rate_limited': 1}
+
+    def test_forbidden_not_retried(self, app):
+        """does not retry other 403 responses"""
+        response, counts = self.get_user(MockResponse(403, {'X-Rate-Limit-Remaining': '350.0'}, 'Unauthorized'))
+        assert not response
+        assert counts['requests'] == 1
+
+    def test_retry_after(self, app):
+        """waits as asked by Retry-After, giving up rather than waiting too long"""
+        response, counts = self.get_user(MockResponse(429, {'Retry-After': '0'}, '{}'), MockResponse(200, {}, '{}'))
+        assert response
+        assert counts['retries'] == 1
+        response, counts = self.get_user(MockResponse(503, {'Retry-After': '3600'}, '{}'), MockResponse(200, {}, '{}'))
+        assert not response
+        assert counts['requests'] == 1
+
+    def test_backoff(self, app, monkeypatch):
+        """backs off exponentially with jitter, up to a maximum"""
+        monkeypatch.setitem(app.config, 'HTTP_RETRY_BACKOFF', 1)
+        monkeypatch.setitem(app.config, 'HTTP_RETRY_MAX_DELAY', 5)
+        for attempt, limit in [(0, 1), (1, 2), (2, 4), (3, 5), (10, 5)]:
+            delays = [http._retry_delay(None, attempt) for n in range(20)]
+            assert all(0 <= delay <= limit for delay in delays)
+            assert len(set(delays)) > 1
+
+
+class TestTimeouts:
+    """HTTP timeouts and deadlines"""
+
+    def test_per_upstream_timeouts(self, app, monkeypatch):
+        """applies connect and read timeouts per upstream"""
+        monkeypatch.setitem(app.config, 'HTTP_TIMEOUTS', {'default': (3, 30), 'canvas': (2, 10)})
+        assert http._timeout('canvas') == (2, 10)
+        assert http._timeout('sis_student_api') == (3, 30)
+        assert http._timeout(None) == (3, 30)
+
+    def test_timeouts_fit_deadline(self, app, monkeypatch):
+        """cuts timeouts down to the time remaining"""
+        monkeypatch.setitem(app.config, 'HTTP_TIMEOUTS', {'default': (3, 30)})
+        assert http._timeout(None, 5) == (3, 5)
+        assert http._timeout(None, 1) == (1, 1)
+        assert http._timeout(None, -1) == (http.MIN_TIMEOUT, http.MIN_TIMEOUT)
+
+    def test_deadline_passed(self, app):
+        """makes no request once the deadline has passed"""
+        before = http.upstream_stats().get('canvas', {}).get('requests', 0)
+        with deadline.limit(0):
+            response = canvas._get_user_for_uid(2040)
+        assert not response
+        assert isinstance(response.exception, http.DeadlineExceeded)
+        assert http.upstream_stats().get('canvas', {}).get('requests', 0) == before
+
+    def test_no_retry_past_deadline(self, app, monkeypatch):
+        """does not retry when the backoff would outlast the deadline"""
+        monkeypatch.setitem(app.config, 'HTTP_RETRY_BACKOFF', 10)
+        monkeypatch.setattr(http.random, 'uniform', lambda low, high: high)
+        with deadline.limit(5):
+            response, counts = TestRetries.get_user(MockResponse(503, {}, '{}'), MockResponse(200, {}, '{}'))
+        assert not response
+        assert counts['requests'] == 1
+
+    def test_rate_limit_wait_past_deadline(self, app, monkeypatch):
+        """gives up rather than wait on the rate limit past the deadline"""
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.tokens = -10
+        monkeypatch.setattr(http, '_rate_limiter', lambda upstream: bucket)
+        before = http.upstream_stats().get('canvas', {}).get('retries', 0)
+        with deadline.limit(1):
+            response = canvas._get_user_for_uid(2040)
+        assert isinstance(response.exception, http.DeadlineExceeded)
+        assert http.upstream_stats()['canvas']['retries'] == before
+
+    def test_wait_uses_up_deadline(self, app, monkeypatch):
+        """gives up rather than send a request when waiting on the rate limit used up the deadline"""
+        bucket = TokenBucket(rate=1, burst=1)
+        # The token comes due just as the deadline passes.
+        monkeypatch.setattr(bucket, 'acquire', lambda timeout: time.sleep(timeout))
+        monkeypatch.setattr(http, '_rate_limiter', lambda upstream: bucket)
+        with deadline.limit(0.1):
+            response = canvas._get_user_for_uid(2040)
+        assert isinstance(response.exception, http.DeadlineExceeded)
+
+    def test_semaphore_wait_past_deadline(self, app, monkeypatch):
+        """gives up rather than wait on the upstream concurrency limit past the deadline"""
+        semaphore = threading.BoundedSemaphore(1)
+        semaphore.acquire()
+        monkeypatch.setattr(http, '_upstream_semaphore', lambda upstream: semaphore)
+        with deadline.limit(0.1):
+            response = canvas._get_user_for_uid(2040)
+        assert isinstance(response.exception, http.DeadlineExceeded)
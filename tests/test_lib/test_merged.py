@@ -18,3 +18,49 @@ class TestMerged:
         # For this test, assume that there are no blank attributes.
         assert athlete.member_uid
         assert athlete.member_name
+
+
+class TestSisEnrollmentIndex:
+    """Matching Canvas sections to SIS enrollments by CCN"""
+
+    def test_section_ccns(self):
+        """takes CCNs from official section IDs only"""
+        sections = [
+            {'sis_section_id': 'SEC:2017-D-90100'},
+            {'sis_section_id': 'SEC:2017-D-90200-88CA51BE'},
+            {'sis_section_id': None},
+            {'sis_section_id': 'Manually created'},
+            {},
+        ]
+        assert subject.section_ccns(sections) == ['90100', '90200']
+
+    def test_enrollment_ccn_index(self):
+        """indexes enrollments by class section CCN, first enrollment first"""
+        enrollments = [
+            {'classSection': {'id': 90100}, 'n': 1},
+            {'classSection': {'id': 90200}, 'n': 2},
+            {'classSection': {'id': 90100}, 'n': 3},
+        ]
+        index = subject.enrollment_ccn_index(enrollments)
+        assert sorted(index) == ['90100', '90200']
+        assert index['90100']['n'] == 1
+
+    def test_section_ccn_index(self, app):
+        """indexes section CCNs by Canvas course ID"""
+        sites = [{'canvasCourseId': 7654320}, {'canvasCourseId': 7654321}, {'canvasCourseId': 7654320}]
+        index = subject.section_ccn_index(sites)
+        assert index[7654320] == ['90100', '90101']
+        assert index[7654321] == ['90200']
+
+    def test_shared_index(self, app):
+        """merges the same enrollments given a shared CCN index"""
+        def sites():
+            return [{'canvasCourseId': 7654320}, {'canvasCourseId': 7654321}, {'canvasCourseId': 7654323}]
+        merged = sites()
+        subject.merge_sis_enrollments(merged, 11667051, 2178)
+        shared_index = subject.section_ccn_index(sites(), 2178)
+        merged_with_index = sites()
+        subject.merge_sis_enrollments(merged_with_index, 11667051, 2178, shared_index)
+        assert merged_with_index == merged
+        assert [len(site['sisEnrollments']) for site in merged] == [1, 1, 1]
+        assert merged[0]['sisEnrollments'][0]['ccn'] == 90100
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import boac.externals.canvas as canvas
+from boac.lib import http
+from boac.lib.mockingbird import MockResponse, register_mock
+from boac.lib.rate_limit import TokenBucket
+import pytest
+
+
+class TestTokenBucket:
+    """Token bucket rate limiter"""
+
+    def test_burst(self):
+        """allows a burst without waiting, then waits for tokens"""
+        bucket = TokenBucket(rate=50, burst=3)
+        assert [bucket.acquire() for n in range(3)] == [0, 0, 0]
+        started_at = time.monotonic()
+        assert bucket.acquire() > 0
+        assert time.monotonic() - started_at >= 0.015
+        assert bucket.stats()['waits'] == 1
+
+    def test_timeout(self):
+        """gives up at once, keeping its token, rather than wait longer than a timeout"""
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.acquire()
+        started_at = time.monotonic()
+        with pytest.raises(TimeoutError):
+            bucket.acquire(timeout=0.5)
+        assert time.monotonic() - started_at < 0.1
+        assert bucket.tokens > -1
+        assert bucket.stats()['waits'] == 0
+        assert bucket.acquire(timeout=2) > 0
+
+    def test_shared_by_threads(self):
+        """keeps concurrent callers within the rate"""
+        bucket = TokenBucket(rate=100, burst=1)
+        started_at = time.monotonic()
+        threads = [threading.Thread(target=lambda: [bucket.acquire() for n in range(5)]) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Twenty tokens, one up front and the rest at 100 per second
+        assert time.monotonic() - started_at >= 0.18
+
+    def test_adapt(self):
+        """slows down as reported quota falls below low water, and recovers"""
+        bucket = TokenBucket(rate=10, burst=10, low_water=200)
+        bucket.adapt(500)
+        assert bucket.rate_factor == 1
+        bucket.adapt(100)
+        assert bucket.rate_factor == 0.5
+        assert bucket.tokens <= 1
+        bucket.adapt(0)
+        assert bucket.rate_factor == TokenBucket.MIN_RATE_FACTOR
+        bucket.adapt(250)
+        assert bucket.rate_factor == 1
+
+    def test_not_adaptive(self):
+        """ignores reported quota without low water"""
+        bucket = TokenBucket(rate=10, burst=10)
+        bucket.adapt(0)
+        assert bucket.rate_factor == 1
+
+
+class TestUpstreamRateLimits:
+    """Rate limits per upstream"""
+
+    def test_canvas_quota(self, app, monkeypatch):
+        """adapts the Canvas rate to X-Rate-Limit-Remaining"""
+        monkeypatch.setitem(app.config, 'HTTP_UPSTREAM_RATE_LIMITS', {'canvas': {'rate': 1000, 'burst': 10, 'low_water': 300}})
+        low_quota = MockResponse(200, {'X-Rate-Limit-Remaining': '150.0'}, '{"id": 1}')
+        with register_mock(canvas._get_user_for_uid, low_quota):
+            assert canvas._get_user_for_uid(2040)
+        assert http._rate_limiter('canvas').rate_factor == 0.5
+        assert http._rate_limiter('sis_student_api') is None
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+started_at = time.perf_counter()
+from boac.factory import create_app
+app = create_app()
+print(json.dumps({
+    'elapsed': time.perf_counter() - started_at,
+    'modules': sorted(module for module in sys.modules if module.split('.')[0] in app.config['STARTUP_IMPORT_DENYLIST']),
+}))
+"""
+
+
+def start_app():
+    """Create the app in a fresh interpreter, so that modules imported by earlier tests do not count."""
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    env = dict(os.environ, BOAC_ENV='test')
+    output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT], cwd=base_dir, env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class TestStartup:
+    """App startup"""
+
+    def test_startup(self, app):
+        """stays within its time budget without importing denylisted modules"""
+        startup = start_app()
+        assert startup['modules'] == []
+        assert startup['elapsed'] < app.config['STARTUP_TIME_BUDGET']
@@ -0,0 +1,290 @@
+from datetime import datetime, timedelta
+import threading
+
+from boac import db
+from boac.externals import canvas
+from boac.lib.cache import LRUCache
+from boac.lib.mockingbird import MockResponse, register_mock
+from boac.models import json_cache
+from boac.models.json_cache import JsonCache
+import pytest
+
+
+@pytest.fixture()
+def lru(monkeypatch):
+    _lru = LRUCache(max_entries=100)
+    monkeypatch.setattr(json_cache, '_lru', _lru)
+    return _lru
+
+
+@pytest.mark.usefixtures('db_session')
+class TestJsonCacheLRU:
+    """JSON cache with in-process LRU"""
+
+    def test_lru_read(self, app, lru):
+        """serves repeated reads from the LRU without reaching the DB"""
+        profile = canvas.get_user_for_uid(2040)
+        assert profile['sortable_name'] == 'Heyer, Oliver'
+        db.session.query(JsonCache).filter(JsonCache.key == 'canvas_user_for_uid_2040').delete(synchronize_session=False)
+        assert canvas.get_user_for_uid(2040) == profile
+        assert lru.stats()['hits'] == 1
+
+    def test_lru_clear(self, app, lru):
+        """invalidates LRU entries with the DB"""
+        canvas.get_user_for_uid(2040)
+        canvas.get_course_sections(7654320)
+        assert lru.stats()['entries'] == 2
+        json_cache.clear('canvas_user_for_uid_%')
+        assert lru.stats()['entries'] == 1
+        json_cache.clear_current_term()
+        assert lru.stats()['entries'] == 0
+
+
+@pytest.mark.usefixtures('db_session')
+class TestJsonCacheBulk:
+    """JSON cache bulk lookup"""
+
+    def test_stow_key(self, app):
+        """exposes the key for a stowed call"""
+        assert canvas.get_user_for_uid.stow_key(2040) == 'canvas_user_for_uid_2040'
+        assert canvas.get_course_sections.stow_key(7654320) == 'term_Fall 2017-canvas_course_sections_7654320'
+
+    def test_stow_many(self, app):
+        """returns results in argument order, stowing missing keys"""
+        canvas.get_user_for_uid(2040)
+        profiles = json_cache.stow_many(canvas.get_user_for_uid, [(242881,), (2040,), (9999999,)])
+        assert profiles[0]['sortable_name'] == 'Kerschen, Paul'
+        assert profiles[1]['sortable_name'] == 'Heyer, Oliver'
+        assert profiles[2] is False
+        assert JsonCache.query.filter_by(key='canvas_user_for_uid_242881').first()
+
+    def test_get_many(self, app):
+        """returns only keys found"""
+        canvas.get_user_for_uid(2040)
+        stowed = json_cache.get_many(['canvas_user_for_uid_2040', 'canvas_user_for_uid_1'])
+        assert list(stowed.keys()) == ['canvas_user_for_uid_2040']
+
+    def test_advisory_lock(self, app, monkeypatch):
+        """stows missing keys under an advisory lock"""
+        monkeypatch.setitem(app.config, 'JSON_CACHE_ADVISORY_LOCKS', True)
+        profiles = json_cache.stow_many(canvas.get_user_for_uid, [(2040,), (2040,)])
+        assert profiles[0]['sortable_name'] == 'Heyer, Oliver'
+        assert profiles[1] == profiles[0]
+        assert JsonCache.query.filter_by(key='canvas_user_for_uid_2040').count() == 1
+        with db.engine.connect() as connection:
+            assert connection.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'").scalar() == 0
+
+    def test_advisory_lock_per_key(self, app, monkeypatch):
+        """holds the advisory lock on a key only while fetching that key"""
+        monkeypatch.setitem(app.config, 'JSON_CACHE_ADVISORY_LOCKS', True)
+        locked_keys = []
+
+        @json_cache.stow('test_advisory_{n}')
+        def fetch(n):
+            with db.engine.connect() as connection:
+                locks = connection.execute(
+                    "SELECT objid FROM pg_locks WHERE locktype = 'advisory' AND granted ORDER BY objid",
+                ).fetchall()
+                keys = connection.execute("SELECT hashtext('test_advisory_1'), hashtext('test_advisory_2')").first()
+            locked_keys.append([n for n, key in zip([1, 2], keys) if key & 0xFFFFFFFF in [lock[0] for lock in locks]])
+            return {'n': n}
+        json_cache.stow_many(fetch, [(1,), (2,)])
+        assert locked_keys == [[1], [2]]
+
+    def test_nested_advisory_lock(self, app, monkeypatch):
+        """takes no advisory lock of its own for a key fetched within a locked fetch"""
+        monkeypatch.setitem(app.config, 'JSON_CACHE_ADVISORY_LOCKS', True)
+        lock_counts = []
+
+        @json_cache.stow('test_advisory_inner')
+        def fetch_inner():
+            with db.engine.connect() as connection:
+                lock_counts.append(connection.execute(
+                    "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND granted",
+                ).scalar())
+            return {'inner': True}
+
+        @json_cache.stow('test_advisory_outer')
+        def fetch_outer():
+            return {'outer': fetch_inner()}
+        assert fetch_outer() == {'outer': {'inner': True}}
+        assert lock_counts == [1]
+        assert JsonCache.query.filter_by(key='test_advisory_inner').first()
+
+
+class TestJsonCacheConcurrency:
+    """JSON cache with worker threads, which need DB connections of their own rather than a test transaction"""
+
+    @pytest.fixture(autouse=True)
+    def clean_up(self, app):
+        yield
+        json_cache.clear('test_concurrent_%')
+        db.session.commit()
+
+    def test_stow_many_concurrently(self, app):
+        """fetches missing keys on worker threads, stowing each once"""
+        barrier = threading.Barrier(3, timeout=5)
+        fetched = []
+
+        @json_cache.stow('test_concurrent_{n}')
+        def fetch(n):
+            barrier.wait()
+            fetched.append(n)
+            return {'n': n}
+        results = json_cache.stow_many(fetch, [(1,), (2,), (3,), (2,)], max_workers=3)
+        assert results == [{'n': 1}, {'n': 2}, {'n': 3}, {'n': 2}]
+        assert sorted(fetched) == [1, 2, 3]
+        assert JsonCache.query.filter(JsonCache.key.like('test_concurrent_%')).count() == 3
+        assert json_cache.stow_many(fetch, [(3,), (1,)], max_workers=3) == [{'n': 3}, {'n': 1}]
+
+
+@pytest.mark.usefixtures('db_session')
+class TestJsonCacheExpiry:
+    """JSON cache expiry"""
+
+    key = 'canvas_user_for_uid_2040'
+
+    def test_ttl(self, app):
+        """stows expiry time per key pattern"""
+        canvas.get_user_for_uid(2040)
+        row = JsonCache.query.filter_by(key=self.key).first()
+        assert row.expires_at - datetime.now() == pytest.approx(timedelta(weeks=1), abs=timedelta(minutes=1))
+
+    def test_expired(self, app, monkeypatch):
+        """refetches expired JSON"""
+        monkeypatch.setitem(app.config, 'JSON_CACHE_STALE_WHILE_REVALIDATE', False)
+        canvas.get_user_for_uid(2040)
+        row = JsonCache.query.filter_by(key=self.key).first()
+        row.json = {'stale': True}
+        row.expires_at = datetime.now() - timedelta(seconds=1)
+        assert canvas.get_user_for_uid(2040)['sortable_name'] == 'Heyer, Oliver'
+        assert row.expires_at > datetime.now() + timedelta(days=6)
+
+    def test_expired_refetch_failure(self, app, monkeypatch):
+        """returns expired JSON if refetch fails"""
+        monkeypatch.setitem(app.config, 'JSON_CACHE_STALE_WHILE_REVALIDATE', False)
+        canvas.get_user_for_uid(2040)
+        row = JsonCache.query.filter_by(key=self.key).first()
+        row.expires_at = datetime.now() - timedelta(seconds=1)
+        canvas_error = MockResponse(500, {}, '{"message": "Internal server error."}')
+        with register_mock(canvas._get_user_for_uid, canvas_error):
+            assert canvas.get_user_for_uid(2040)['sortable_name'] == 'Heyer, Oliver'
+        assert row.expires_at < datetime.now()
+
+    def test_refresh_ahead(self, app):
+        """returns JSON nearing expiry and refreshes it"""
+        canvas.get_user_for_uid(2040)
+        row = JsonCache.query.filter_by(key=self.key).first()
+        row.json = {'stale': True}
+        row.expires_at = datetime.now() + timedelta(hours=1)
+        assert canvas.get_user_for_uid(2040) == {'stale': True}
+        assert row.json['sortable_name'] == 'Heyer, Oliver'
+        assert row.expires_at > datetime.now() + timedelta(days=6)
+
+    def test_stale_while_revalidate(self, app):
+        """returns expired JSON to requests and refreshes it"""
+        canvas.get_user_for_uid(2040)
+        row = JsonCache.query.filter_by(key=self.key).first()
+        row.json = {'stale': True}
+        row.expires_at = datetime.now() - timedelta(minutes=1)
+        served_stale = json_cache.staleness_stats()['served_stale']
+        assert canvas.get_user_for_uid(2040) == {'stale': True}
+        assert row.json['sortable_name'] == 'Heyer, Oliver'
+        stats = json_cache.staleness_stats()
+        assert stats['served_stale'] == served_stale + 1
+        assert stats['max_staleness'] >= 60
+
+    def test_expire(self, app):
+        """marks entries expired without deleting them"""
+        canvas.get_user_for_uid(2040)
+        canvas.get_course_sections(7654320)
+        json_cache.expire('canvas_user_%')
+        assert JsonCache.query.filter_by(key=self.key).first().expires_at <= datetime.now()
+        assert JsonCache.query.filter_by(key=canvas.get_course_sections.stow_key(7654320)).first().expires_at > datetime.now()
+        assert not json_cache.get_many([self.key])
+
+
+@pytest.mark.usefixtures('db_session')
+class TestJsonCacheCompression:
+    """JSON cache compressed storage"""
+
+    def test_large_payload(self, app):
+        """stores large payloads compressed and decodes them transparently"""
+        summaries = canvas.get_student_summaries(7654321)
+        row = JsonCache.query.filter_by(key=canvas.get_student_summaries.stow_key(7654321)).first()
+        assert row.json is None
+        assert row.data[0] == json_cache.FORMAT_ZLIB_JSON
+        assert row.get_json() == summaries
+        assert json_cache.get_many([row.key])[row.key] == summaries
+
+    def test_small_payload(self, app):
+        """stores small payloads as JSONB"""
+        profile = canvas.get_user_for_uid(2040)
+        row = JsonCache.query.filter_by(key='canvas_user_for_uid_2040').first()
+        assert row.json == profile
+        assert row.data is None
+
+    def test_unknown_format(self, app):
+        """refuses to decode an unknown format version"""
+        with pytest.raises(ValueError):
+            json_cache.decode_json(b'\x7f{}')
+
+
+class FakeFeed:
+    def __init__(self, pages, fail=False):
+        self._pages = pages
+        self.fail = fail
+        self.failed = False
+
+    def pages(self):
+        yield from self._pages
+        self.failed = self.fail
+
+
+@pytest.mark.usefixtures('db_session')
+class TestJsonCachePages:
+    """JSON cache append mode"""
+
+    key = 'test_paged_feed'
+
+    def test_stow_pages(self, app):
+        """appends pages to a stowed array"""
+        assert json_cache.is_due(self.key)
+        assert json_cache.stow_pages(self.key, FakeFeed([[1, 2], [3], []]), timedelta(hours=1)) == 3
+        row = JsonCache.query.filter_by(key=self.key).first()
+        assert row.get_json() == [1, 2, 3]
+        assert row.data is None
+        assert not json_cache.is_due(self.key, timedelta(hours=1))
+
+    def test_compressed(self, app, monkeypatch):
+        """compresses an array once it reaches the compression threshold"""
+        monkeypatch.setitem(app.config, 'JSON_CACHE_COMPRESSION_THRESHOLD', 10)
+        pages = [[{'id': n}, {'id': n + 1}] for n in range(0, 100, 2)]
+        assert json_cache.stow_pages(self.key, FakeFeed(pages)) == 100
+        row = JsonCache.query.filter_by(key=self.key).first()
+        assert row.json is None
+        assert row.get_json() == [{'id': n} for n in range(100)]
+
+    def test_on_page(self, app):
+        """passes each page to on_page as it is stowed"""
+        seen = []
+        json_cache.stow_pages(self.key, FakeFeed([[1, 2], [3]]), on_page=seen.append)
+        assert seen == [[1, 2], [3]]
+
+    def test_replaces_existing(self, app):
+        """replaces a previously stowed array"""
+        json_cache.stow_pages(self.key, FakeFeed([[1, 2]]))
+        json_cache.stow_pages(self.key, FakeFeed([[3], [4]]))
+        assert JsonCache.query.filter_by(key=self.key).first().get_json() == [3, 4]
+
+    def test_failed_feed(self, app):
+        """leaves the stowed array as it was when the feed fails"""
+        json_cache.stow_pages(self.key, FakeFeed([[1, 2]]))
+        assert json_cache.stow_pages(self.key, FakeFeed([[3], [4]], fail=True)) is None
+        assert JsonCache.query.filter_by(key=self.key).first().get_json() == [1, 2]
+
+    def test_due_for_refresh(self, app):
+        """is due once past the refresh-ahead point"""
+        json_cache.stow_pages(self.key, FakeFeed([[1]]), timedelta(hours=1))
+        assert not json_cache.is_due(self.key, timedelta(hours=1))
+        assert json_cache.is_due(self.key, timedelta(hours=10))
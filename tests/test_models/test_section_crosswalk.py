@@ -0,0 +1,52 @@
+from boac.api import cache_utils
+from boac.externals import canvas
+from boac.lib import merged
+from boac.lib.mockingbird import MockResponse, register_mock
+from boac.models.section_crosswalk import SectionCrosswalk
+import pytest
+
+
+sections = [
+    {'id': 5000000, 'sis_section_id': 'SEC:2017-D-90100'},
+    {'id': 5000001, 'sis_section_id': 'SEC:2017-C-90101'},
+    {'id': 6000000, 'sis_section_id': None},
+]
+
+
+@pytest.mark.usefixtures('db_session')
+class TestSectionCrosswalk:
+    """Canvas section to SIS CCN crosswalk"""
+
+    def test_ccns_for_courses(self):
+        """returns CCNs by Canvas course ID, in section order"""
+        SectionCrosswalk.refresh_course(1, sections)
+        SectionCrosswalk.refresh_course(2, [{'id': 7000000, 'sis_section_id': None}])
+        assert SectionCrosswalk.ccns_for_courses([1, 2, 3]) == {1: ['90100', '90101'], 2: []}
+        assert SectionCrosswalk.ccns_for_courses([1], '2178') == {1: ['90100']}
+        assert SectionCrosswalk.ccns_for_courses([1], 2178) == {1: ['90100']}
+        assert SectionCrosswalk.ccns_for_courses([]) == {}
+
+    def test_refresh_course(self):
+        """replaces the rows for a course"""
+        SectionCrosswalk.refresh_course(1, sections)
+        SectionCrosswalk.refresh_course(1, sections[:1])
+        assert SectionCrosswalk.ccns_for_courses([1]) == {1: ['90100']}
+
+    def test_duplicate_sections(self):
+        """records a section listed twice in the feed once"""
+        SectionCrosswalk.refresh_course(1, sections + sections[:1])
+        assert SectionCrosswalk.ccns_for_courses([1]) == {1: ['90100', '90101']}
+
+    def test_built_while_loading_cache(self, app):
+        """is built when loading a course site's externals"""
+        cache_utils.load_canvas_course_externals(7654320)
+        assert SectionCrosswalk.ccns_for_courses([7654320]) == {7654320: ['90100', '90101']}
+
+    def test_merge_without_section_feeds(self, app):
+        """lets enrollments be merged without Canvas section feeds"""
+        SectionCrosswalk.refresh_course(7654320, [{'id': 5000000, 'sis_section_id': 'SEC:2017-D-90100'}])
+        sites = [{'canvasCourseId': 7654320}]
+        with register_mock(canvas._get_course_sections, MockResponse(500, {}, '{}')):
+            assert merged.section_ccn_index(sites, '2178') == {7654320: ['90100']}
+            merged.merge_sis_enrollments(sites, 11667051, '2178')
+        assert sites[0]['sisEnrollments'][0]['ccn'] == 90100